@@ -4,6 +4,17 @@
 NOM_CONNEXION = "VPN_PPTP"
 IDENTIFIANT = "vpnbook"
 MDP_FILE = 'mdp.json'
+LOG_FILE = 'vpn_logs.txt'
+TIMINGS_FILE = 'timings.jsonl'
+TIMINGS_PROM_FILE = 'timings.prom'
+DIAGNOSTICS_DIR = 'diagnostics'
+LATENCY_CACHE_FILE = 'latences.json'
+URL_PATTERNS_FILE = 'motifs_image.json'
+COOKIES_FILE = 'cookies.json'
+DIAL_HISTORY_FILE = 'historique_connexions.json'
+HTTP_CACHE_DIR = 'http_cache'
+LATENCY_TTL = 600  # durée de validité (s) d'une latence mémorisée
+PPTP_PORT = 1723
 PAGE_URL = "https://www.vpnbook.com/freevpn"  # conserver SANS slash final pour éviter 404 à l'ouverture
 
 SERVERS = {
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Mode diagnostic optionnel : blocages de la boucle Tk et profilage.
+
+Activé par la variable d'environnement VPNBOOK_DIAGNOSTICS=1 ou l'option
+``--diagnostics`` ; ``--profile`` (ou VPNBOOK_PROFILE=1) y ajoute cProfile
+et tracemalloc. Sans ces options, rien n'est chargé ni planifié.
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from constants import DIAGNOSTICS_DIR
+from timing import SPANS
+
+# Intervalle (ms) du battement planifié avec after() et retard (ms) au-delà
+# duquel la boucle principale est considérée comme bloquée
+HEARTBEAT_MS = 100
+STALL_THRESHOLD_MS = 250
+# Nombre de blocages dont la pile est conservée, et lignes du rapport mémoire
+MAX_STALLS = 50
+TOP_ALLOCATIONS = 25
+
+
+class StallDetector:
+    """Mesure le retard des callbacks after() et capture les blocages.
+
+    Un battement replanifié toutes les HEARTBEAT_MS ms note l'écart entre
+    l'heure prévue et l'heure réelle d'exécution. Un thread de surveillance
+    vérifie que le battement progresse : si la boucle Tk reste bloquée plus
+    de ``threshold_ms``, la pile du thread principal est enregistrée, ce qui
+    désigne le gestionnaire fautif pendant qu'il s'exécute encore.
+    """
+
+    def __init__(self, root, interval_ms=HEARTBEAT_MS, threshold_ms=STALL_THRESHOLD_MS):
+        self._root = root
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.beats = 0
+        self.late_beats = 0
+        self.max_lateness_ms = 0.0
+        self.total_lateness_ms = 0.0
+        self.stalls = []
+        self._main_ident = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._expected = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._expected = time.perf_counter() + self.interval_ms / 1000
+        self._root.after(self.interval_ms, self._beat)
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        if self._stop.is_set():
+            return
+        now = time.perf_counter()
+        lateness = max(0.0, (now - self._expected) * 1000)
+        self.beats += 1
+        self.total_lateness_ms += lateness
+        self.max_lateness_ms = max(self.max_lateness_ms, lateness)
+        if lateness >= self.threshold_ms:
+            self.late_beats += 1
+            SPANS.record("tk_stall", lateness)
+        self._last_beat = now
+        self._expected = now + self.interval_ms / 1000
+        self._root.after(self.interval_ms, self._beat)
+
+    def _watch(self):
+        captured_for = None
+        period = self.threshold_ms / 2000
+        while not self._stop.wait(period):
+            last = self._last_beat
+            blocked_ms = (time.perf_counter() - last) * 1000 - self.interval_ms
+            # Une seule capture par blocage : tant que le battement n'a pas repris
+            if blocked_ms < self.threshold_ms or captured_for == last:
+                continue
+            captured_for = last
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None or len(self.stalls) >= MAX_STALLS:
+                continue
+            self.stalls.append((time.time(), blocked_ms, traceback.format_stack(frame)))
+
+    def report(self):
+        """Résumé texte des retards et des piles capturées."""
+        moyenne = self.total_lateness_ms / self.beats if self.beats else 0.0
+        lines = [
+            f"Battements : {self.beats} (toutes les {self.interval_ms} ms)",
+            f"Retard moyen : {moyenne:.1f} ms, maximal : {self.max_lateness_ms:.1f} ms",
+            f"Battements en retard de plus de {self.threshold_ms} ms : {self.late_beats}",
+            f"Blocages capturés : {len(self.stalls)}",
+        ]
+        for when, blocked_ms, stack in self.stalls:
+            lines.append("")
+            lines.append(
+                f"--- {time.strftime('%H:%M:%S', time.localtime(when))} "
+                f"boucle bloquée depuis {blocked_ms:.0f} ms :"
+            )
+            lines.extend(line.rstrip() for line in stack)
+        return "\n".join(lines) + "\n"
+
+
+class Diagnostics:
+    """Session de diagnostic : détecteur de blocages et profilage optionnel."""
+
+    def __init__(self, profile=False, directory=DIAGNOSTICS_DIR):
+        self.profile = profile
+        self.directory = directory
+        self.detector = None
+
+    @classmethod
+    def from_environment(cls, argv=None, environ=None):
+        """Retourne une session si le mode diagnostic est demandé, sinon None."""
+        argv = sys.argv[1:] if argv is None else argv
+        environ = os.environ if environ is None else environ
+        profile = "--profile" in argv or environ.get("VPNBOOK_PROFILE") == "1"
+        if not (profile or "--diagnostics" in argv or environ.get("VPNBOOK_DIAGNOSTICS") == "1"):
+            return None
+        return cls(profile=profile)
+
+    def attach(self, root):
+        """Démarre le détecteur de blocages sur la boucle de ``root``."""
+        self.detector = StallDetector(root)
+        self.detector.start()
+
+    @contextmanager
+    def session(self):
+        """Encadre la boucle principale ; les rapports sont écrits à la sortie."""
+        profiler = None
+        if self.profile:
+            import cProfile
+            import tracemalloc
+
+            tracemalloc.start()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if self.detector is not None:
+                self.detector.stop()
+            self._dump(profiler)
+
+    def _dump(self, profiler):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.detector is not None:
+                self._write("blocages.txt", self.detector.report())
+            if profiler is not None:
+                import tracemalloc
+
+                profiler.dump_stats(os.path.join(self.directory, "profil.pstats"))
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                top = snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                self._write("memoire.txt", "\n".join(str(stat) for stat in top) + "\n")
+        except OSError:
+            pass
+
+    def _write(self, name, text):
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            f.write(text)
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""Composition des connexions VPN : chemin de connexion et course entre serveurs."""
+
+import subprocess
+import threading
+import time
+
+from timing import SPANS
+from vpn_ops import (
+    SERVER_LATENCIES,
+    STATUS,
+    classer_erreur_rasdial,
+    composer_profil,
+    creer_ou_mettre_a_jour_vpn,
+    marquer_connecte,
+    nom_profil_serveur,
+    raccrocher_profil,
+    rank_servers,
+    record_dial,
+)
+
+# Nombre de serveurs mis en concurrence par « VPN le plus rapide »
+RACE_TOP_K = 3
+# Délai (s) accordé à une tentative avant de lancer la suivante
+STAGGER_DELAY = 3.0
+# Durée maximale (s) de la course complète
+RACE_DEADLINE = 60.0
+
+# Supervision : intervalle de vérification (s), seuils de dégradation et
+# nombre de vérifications dégradées consécutives avant de changer de serveur
+SUPERVISION_INTERVAL = 2.0
+DEGRADED_LATENCY_MS = 400
+DEGRADED_LOSS_RATE = 0.3
+DEGRADED_CHECKS = 5
+# Reprise : délai initial et maximal (s) entre deux tentatives, tentatives
+# sur le même serveur avant de passer au suivant, tentatives au total
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRIES_SAME_SERVER = 2
+MAX_ATTEMPTS = 8
+
+
+class RasdialBackend:
+    """Chemin de connexion réel : profils Windows et rasdial.
+
+    Un backend expose ``prepare(hôte, split)`` qui retourne le nom du profil
+    à composer, ``dial(nom, mot_de_passe)`` qui lève
+    subprocess.CalledProcessError en cas d'échec, ``hangup(nom)``,
+    ``commit(nom)`` appelé pour la connexion retenue et ``record(hôte, ok,
+    durée, sortie)`` qui enregistre le résultat d'une composition. Un
+    substitut qui respecte cette interface permet de tester la course sans
+    rasdial ni historique sur disque.
+
+    ``pool`` est le pool de profils pré-configurés, à ne passer que si
+    l'option est active. Sans profil prêt, ``shared`` (nom du profil commun)
+    est pointé vers le serveur ; à défaut, un profil dédié au serveur est
+    créé, ce dont la course a besoin pour composer en parallèle.
+    """
+
+    def __init__(self, pool=None, shared=None):
+        self.pool = pool
+        self.shared = shared
+
+    def prepare(self, host, split_tunneling):
+        nom = self.pool.profile_for(host, split_tunneling) if self.pool is not None else None
+        if nom is None:
+            nom = self.shared or nom_profil_serveur(host)
+            creer_ou_mettre_a_jour_vpn(host, split_tunneling, nom=nom)
+        return nom
+
+    def dial(self, nom, mot_de_passe):
+        composer_profil(nom, mot_de_passe)
+
+    def hangup(self, nom):
+        raccrocher_profil(nom)
+
+    def commit(self, nom):
+        marquer_connecte(nom)
+
+    def record(self, host, ok, duration_ms=None, output=""):
+        record_dial(host, ok, duration_ms, output)
+
+
+class RaceFailed(Exception):
+    """Aucune candidate n'a pu se connecter.
+
+    ``errors`` contient les couples ``(hôte, exception)`` dans l'ordre des
+    échecs ; ``output`` reprend la sortie rasdial du dernier échec.
+    """
+
+    def __init__(self, errors):
+        super().__init__("Aucun serveur n'a pu être connecté.")
+        self.errors = errors
+        last = errors[-1][1] if errors else None
+        self.output = getattr(last, "output", "") or (str(last) if last else "")
+
+
+def race_connect(candidates, mot_de_passe, split_tunneling=False, backend=None,
+                 stagger=STAGGER_DELAY, deadline=RACE_DEADLINE, on_event=None):
+    """Connecte le premier serveur qui répond parmi les candidates classées.
+
+    La première candidate est lancée seule ; si elle n'a pas abouti après
+    ``stagger`` secondes (ou dès qu'elle échoue), la suivante est lancée, et
+    ainsi de suite. La première connexion établie l'emporte : les autres
+    tentatives sont abandonnées et les tunnels établis en retard sont
+    raccrochés. ``candidates`` est une liste de ``(pays, hôte)`` ;
+    ``on_event(texte)`` reçoit les étapes à journaliser.
+
+    Retourne ``(pays, hôte, nom du profil)`` ou lève RaceFailed.
+    """
+    backend = backend or RasdialBackend()
+    notify = on_event or (lambda texte: None)
+    lock = threading.Lock()
+    changed = threading.Event()
+    state = {"winner": None, "finished": 0, "closed": False}
+    errors = []
+    run_id = SPANS.current_run()
+
+    def attempt(country, host):
+        # Les mesures de la tentative restent rattachées à la connexion
+        with SPANS.run(run_id):
+            _attempt(country, host)
+
+    def _attempt(country, host):
+        nom = None
+        try:
+            nom = backend.prepare(host, split_tunneling)
+            with lock:
+                if state["winner"] is not None or state["closed"]:
+                    return
+            debut = time.monotonic()
+            backend.dial(nom, mot_de_passe)
+            backend.record(host, True, (time.monotonic() - debut) * 1000)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as ex:
+            if nom is not None:
+                backend.record(host, False, output=getattr(ex, "output", ""))
+            with lock:
+                errors.append((host, ex))
+                state["finished"] += 1
+            notify(f"Échec de la tentative vers {host}.")
+            changed.set()
+            return
+        with lock:
+            won = state["winner"] is None and not state["closed"]
+            if won:
+                backend.commit(nom)
+                state["winner"] = (country, host, nom)
+            state["finished"] += 1
+        if not won:
+            # Tunnel établi après la course : le raccrocher
+            backend.hangup(nom)
+        changed.set()
+
+    end = time.monotonic() + deadline
+    started = 0
+    next_start = time.monotonic()
+    while True:
+        with lock:
+            if state["winner"] is not None:
+                break
+            all_done = state["finished"] >= len(candidates)
+            idle = started - state["finished"] == 0
+        if all_done:
+            break
+        now = time.monotonic()
+        if now >= end:
+            break
+        if started < len(candidates) and (now >= next_start or idle):
+            country, host = candidates[started]
+            notify(f"Tentative de connexion vers {host}...")
+            threading.Thread(target=attempt, args=(country, host), daemon=True).start()
+            started += 1
+            next_start = now + stagger
+            continue
+        wait_for = end - now
+        if started < len(candidates):
+            wait_for = min(wait_for, max(0.0, next_start - now))
+        changed.wait(wait_for)
+        changed.clear()
+
+    with lock:
+        state["closed"] = True
+        winner = state["winner"]
+    if winner is None:
+        raise RaceFailed(list(errors) or [(None, TimeoutError("Délai de connexion dépassé"))])
+    return winner
+
+
+class Supervisor:
+    """Automate de supervision d'une connexion établie.
+
+    États : "connecte", "degrade", "reconnexion", "arrete" et "echec". Une
+    coupure (état de STATUS) ou une dégradation persistante de la latence ou
+    des pertes déclenche une reprise : nouvelles tentatives espacées d'un
+    délai exponentiel, sur le même serveur ou sur le suivant du classement
+    selon l'erreur rasdial (807 : bascule immédiate ; 619 et autres : même
+    serveur jusqu'à RETRIES_SAME_SERVER fois). Une reprise sur le même
+    serveur recompose le profil en place sans le modifier ; seul le passage
+    à un autre serveur prépare un profil. ``on_state(état, pays, hôte,
+    texte)`` est appelé à chaque transition.
+    """
+
+    def __init__(self, country, host, nom, mot_de_passe, split_tunneling=False,
+                 backend=None, status=STATUS, ranking=rank_servers, on_state=None,
+                 interval=SUPERVISION_INTERVAL):
+        self.country = country
+        self.host = host
+        self.nom = nom
+        self.state = "connecte"
+        self._mot_de_passe = mot_de_passe
+        self._split = split_tunneling
+        self._backend = backend or RasdialBackend()
+        self._status = status
+        self._ranking = ranking
+        self._on_state = on_state or (lambda *args: None)
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        # Exécution de la connexion supervisée, reprise par le thread
+        self._run_id = SPANS.current_run()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arrête la supervision (sans toucher à la connexion)."""
+        self._stop.set()
+        if self.state != "echec":
+            self.state = "arrete"
+
+    def _set_state(self, state, texte):
+        self.state = state
+        self._on_state(state, self.country, self.host, texte)
+
+    def _degraded(self):
+        stats = SERVER_LATENCIES.get((self.country, self.host))
+        if stats is None or stats.count < 3:
+            return False
+        return (
+            stats.loss_rate >= DEGRADED_LOSS_RATE
+            or (stats.ewma is not None and stats.ewma >= DEGRADED_LATENCY_MS)
+        )
+
+    def _run(self):
+        with SPANS.run(self._run_id):
+            self._watch()
+
+    def _watch(self):
+        bad_checks = 0
+        while not self._stop.wait(self._interval):
+            if not self._status.get():
+                self._recover("Connexion perdue.", failover=False)
+                bad_checks = 0
+            elif self._degraded():
+                bad_checks += 1
+                if bad_checks == 1:
+                    self._set_state("degrade", "Qualité de connexion dégradée.")
+                if bad_checks >= DEGRADED_CHECKS:
+                    self._recover("Dégradation persistante, changement de serveur.", failover=True)
+                    bad_checks = 0
+            elif bad_checks:
+                bad_checks = 0
+                self._set_state("connecte", "Qualité de connexion rétablie.")
+            if self.state == "echec":
+                return
+
+    def _next_server(self, excluded):
+        for country, host, _ in self._ranking():
+            if host not in excluded:
+                return country, host
+        return None
+
+    def _recover(self, raison, failover):
+        self._set_state("reconnexion", raison)
+        ancien_nom = self.nom
+        country, host = self.country, self.host
+        excluded = set()
+        same_server_failures = 0
+        if failover:
+            excluded.add(host)
+            choix = self._next_server(excluded)
+            if choix:
+                country, host = choix
+        for attempt in range(MAX_ATTEMPTS):
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            if self._stop.wait(delay):
+                return
+            nom = None
+            try:
+                if host == self.host and ancien_nom:
+                    nom = ancien_nom
+                else:
+                    nom = self._backend.prepare(host, self._split)
+                    if nom == ancien_nom:
+                        # Profil commun repointé : quitter l'ancien serveur
+                        self._backend.hangup(ancien_nom)
+                debut = time.monotonic()
+                self._backend.dial(nom, self._mot_de_passe)
+                self._backend.record(host, True, (time.monotonic() - debut) * 1000)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as ex:
+                if nom is not None:
+                    self._backend.record(host, False, output=getattr(ex, "output", ""))
+                code = classer_erreur_rasdial(getattr(ex, "output", ""))
+                same_server_failures += 1
+                if code == "807" or same_server_failures > RETRIES_SAME_SERVER:
+                    excluded.add(host)
+                    choix = self._next_server(excluded)
+                    if choix:
+                        country, host = choix
+                    same_server_failures = 0
+                self._set_state(
+                    "reconnexion",
+                    f"Échec de la reprise (erreur {code}), nouvel essai vers {host}.",
+                )
+                continue
+            if self._stop.is_set():
+                # Supervision arrêtée pendant la composition : ne rien garder
+                self._backend.hangup(nom)
+                return
+            if ancien_nom and ancien_nom != nom:
+                self._backend.hangup(ancien_nom)
+            self._backend.commit(nom)
+            self.country, self.host, self.nom = country, host, nom
+            self._set_state("connecte", f"Connexion rétablie vers {host}.")
+            return
+        self._set_state("echec", "Impossible de rétablir la connexion.")
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Moteur ICMP multiplexé : un seul socket pour sonder plusieurs hôtes."""
+
+import itertools
+import os
+import queue
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Décalage de l'identifiant pour distinguer les balayages simultanés
+_sweep_ids = itertools.count()
+
+_PAYLOAD = b"vpnbook-gui".ljust(32, b"\0")
+
+# Résolutions DNS menées en parallèle pendant un balayage, et intervalle (s)
+# auquel l'attente des réponses revient vérifier les noms résolus
+RESOLVE_WORKERS = 16
+RESOLVE_POLL = 0.02
+
+
+def _checksum(data):
+    """Somme de contrôle Internet (RFC 1071)."""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _build_echo(ident, seq):
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + _PAYLOAD)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + _PAYLOAD
+
+
+def open_socket():
+    """Ouvre un socket ICMP et retourne ``(socket, datagramme)``.
+
+    Un socket datagramme non privilégié est préféré lorsque le système le
+    permet (Linux, macOS) ; sinon un socket brut est utilisé, ce qui demande
+    des droits administrateur. Lève OSError si aucun des deux n'est possible.
+    """
+    if not sys.platform.startswith("win"):
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), True
+        except OSError:
+            pass
+    return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), False
+
+
+def _resolve(hosts):
+    """Lance la résolution DNS des hôtes en parallèle.
+
+    Retourne ``(adresses, file, nombre)`` : les adresses IP données telles
+    quelles, la file où arrivent les couples ``(hôte, adresse ou None)`` des
+    noms à résoudre, et le nombre de ces noms. Les threads de résolution sont des
+    démons : un DNS lent ne retient ni le balayage ni le processus.
+    """
+    addresses = {}
+    names = queue.Queue()
+    for host in hosts:
+        try:
+            socket.inet_aton(host)
+        except OSError:
+            names.put(host)
+        else:
+            addresses[host] = host
+    resolved = queue.Queue()
+    count = names.qsize()
+
+    def worker():
+        while True:
+            try:
+                host = names.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                resolved.put((host, socket.gethostbyname(host)))
+            except OSError:
+                resolved.put((host, None))
+
+    for _ in range(min(RESOLVE_WORKERS, count)):
+        threading.Thread(target=worker, daemon=True).start()
+    return addresses, resolved, count
+
+
+def sweep(hosts, timeout=5.0, on_result=None, stop=None):
+    """Envoie un écho ICMP à chaque hôte et attend les réponses.
+
+    Toutes les requêtes partent du même socket ; les réponses sont associées
+    par identifiant et numéro de séquence. Retourne un dictionnaire
+    ``{hôte: latence en ms ou None}`` une fois toutes les réponses reçues ou
+    ``timeout`` écoulé. La résolution DNS compte dans ``timeout`` : chaque
+    hôte est sondé dès que son adresse est connue, et ceux qui ne sont pas
+    résolus à temps restent à None. ``on_result(hôte, latence)`` est appelé
+    dès qu'une réponse arrive ; si ``stop`` (threading.Event) est
+    positionné, l'attente s'interrompt après la réponse en cours. Lève
+    OSError si le socket ICMP ne peut pas être ouvert.
+    """
+    hosts = list(dict.fromkeys(hosts))
+    results = dict.fromkeys(hosts)
+    end = time.monotonic() + timeout
+    sock, dgram = open_socket()
+    try:
+        sock.setblocking(False)
+        if dgram:
+            # Le noyau remplace l'identifiant par le port local du socket
+            sock.bind(("", 0))
+            ident = sock.getsockname()[1] & 0xFFFF
+        else:
+            ident = (os.getpid() + next(_sweep_ids)) & 0xFFFF
+        sequence = {host: seq for seq, host in enumerate(hosts, start=1)}
+        addresses, resolved, unresolved = _resolve(hosts)
+        pending = {}
+        sent_at = {}
+
+        def send(host, address):
+            seq = sequence[host]
+            try:
+                sock.sendto(_build_echo(ident, seq), (address, 0))
+            except OSError:
+                return
+            pending[seq] = host
+            sent_at[seq] = time.perf_counter()
+
+        for host, address in addresses.items():
+            send(host, address)
+        while pending or unresolved:
+            while unresolved:
+                try:
+                    host, address = resolved.get_nowait()
+                except queue.Empty:
+                    break
+                unresolved -= 1
+                if address is not None:
+                    addresses[host] = address
+                    send(host, address)
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            if unresolved:
+                # Revenir régulièrement aux résolutions en cours
+                remaining = min(remaining, RESOLVE_POLL)
+            elif not pending:
+                break
+            readable, _, _ = select.select([sock], [], [], remaining)
+            if not readable:
+                if unresolved:
+                    continue
+                break
+            try:
+                packet, (src, _) = sock.recvfrom(2048)
+            except OSError:
+                continue
+            received = time.perf_counter()
+            if not dgram:
+                # Un socket brut reçoit aussi l'en-tête IP
+                packet = packet[(packet[0] & 0x0F) * 4:]
+            if len(packet) < 8:
+                continue
+            type_, _, _, r_ident, r_seq = struct.unpack("!BBHHH", packet[:8])
+            if type_ != ICMP_ECHO_REPLY or r_ident != ident or r_seq not in pending:
+                continue
+            host = pending[r_seq]
+            if addresses[host] != src:
+                continue
+            del pending[r_seq]
+            results[host] = max(1, round((received - sent_at[r_seq]) * 1000))
+            if on_result:
+                on_result(host, results[host])
+            if stop is not None and stop.is_set():
+                break
+    finally:
+        sock.close()
+    return results
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Statistiques de latence par serveur sur un tampon circulaire de taille fixe."""
+
+import math
+import time
+from array import array
+
+# Nombre d'échantillons conservés par serveur
+WINDOW = 32
+# Poids du dernier échantillon dans la moyenne mobile exponentielle
+EWMA_ALPHA = 0.3
+
+# Valeur stockée pour un échantillon perdu (aucune réponse)
+_PERTE = -1.0
+
+
+class LatencyStats:
+    """Derniers échantillons de latence d'un serveur et indicateurs dérivés.
+
+    Les échantillons sont conservés dans un ``array`` de taille fixe : la
+    mémoire utilisée reste constante quel que soit le nombre de mesures.
+    """
+
+    __slots__ = ("_samples", "_index", "_count", "_ewma", "updated_at")
+
+    def __init__(self, window=WINDOW):
+        self._samples = array("d", [_PERTE]) * window
+        self._index = 0
+        self._count = 0
+        self._ewma = None
+        self.updated_at = None
+
+    def add(self, latency, timestamp=None):
+        """Ajoute une mesure en ms, ou None pour une perte."""
+        value = _PERTE if latency is None else float(latency)
+        self._samples[self._index] = value
+        self._index = (self._index + 1) % len(self._samples)
+        self._count = min(self._count + 1, len(self._samples))
+        if latency is not None:
+            if self._ewma is None:
+                self._ewma = value
+            else:
+                self._ewma += EWMA_ALPHA * (value - self._ewma)
+        self.updated_at = time.time() if timestamp is None else timestamp
+
+    def samples(self):
+        """Retourne les échantillons du plus ancien au plus récent (None = perte)."""
+        size = len(self._samples)
+        start = (self._index - self._count) % size
+        out = []
+        for i in range(self._count):
+            value = self._samples[(start + i) % size]
+            out.append(None if value == _PERTE else value)
+        return out
+
+    def to_dict(self):
+        """Représentation sérialisable en JSON."""
+        return {"samples": self.samples(), "ewma": self._ewma, "updated_at": self.updated_at}
+
+    @classmethod
+    def from_dict(cls, data, window=WINDOW):
+        """Reconstruit des statistiques à partir de ``to_dict``."""
+        stats = cls(window)
+        for value in data.get("samples", [])[-window:]:
+            stats.add(value)
+        if data.get("ewma") is not None:
+            stats._ewma = float(data["ewma"])
+        stats.updated_at = data.get("updated_at")
+        return stats
+
+    def _valeurs(self):
+        return sorted(v for v in self.samples() if v is not None)
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def last(self):
+        if not self._count:
+            return None
+        value = self._samples[self._index - 1]
+        return None if value == _PERTE else value
+
+    @property
+    def ewma(self):
+        return self._ewma
+
+    @property
+    def minimum(self):
+        valeurs = self._valeurs()
+        return valeurs[0] if valeurs else None
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+    def percentile(self, pct):
+        """Percentile par rang le plus proche des échantillons reçus."""
+        valeurs = self._valeurs()
+        if not valeurs:
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(valeurs)))
+        return valeurs[rank - 1]
+
+    @property
+    def jitter(self):
+        """Écart moyen entre deux échantillons reçus consécutifs (en ms)."""
+        valeurs = [v for v in self.samples() if v is not None]
+        if len(valeurs) < 2:
+            return 0.0
+        return sum(abs(b - a) for a, b in zip(valeurs, valeurs[1:])) / (len(valeurs) - 1)
+
+    @property
+    def loss_rate(self):
+        if not self._count:
+            return 0.0
+        return sum(1 for v in self.samples() if v is None) / self._count
+
+    def score(self):
+        """Valeur de classement (plus petit = meilleur), ou None sans réponse.
+
+        La moyenne mobile est pénalisée par la gigue et par le taux de perte.
+        """
+        if self._ewma is None:
+            return None
+        return (self._ewma + self.jitter) / max(0.05, 1.0 - self.loss_rate)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Journal de l'application : file thread-safe et fichier tournant."""
+
+import os
+import threading
+import time
+from collections import deque
+
+from constants import LOG_FILE
+
+# Taille (octets) au-delà de laquelle le fichier journal est renommé, et
+# nombre d'anciens fichiers conservés (vpn_logs.txt.1, .2, ...)
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+# Nombre maximal de lignes retirées de la file en une fois
+LOG_BATCH = 200
+# Lignes en attente conservées au plus pour l'interface et pour le fichier ;
+# au-delà, les plus anciennes sont abandonnées
+LOG_UI_BUFFER = 1000
+LOG_FILE_BUFFER = 10000
+
+
+class RotatingFileSink:
+    """Fichier journal ouvert en ajout, renommé quand il devient trop gros.
+
+    Les lignes sont écrites par lots depuis un thread dédié : les
+    producteurs ne font jamais d'entrée/sortie. Si le disque ne suit pas,
+    la file garde au plus ``buffer`` lignes en abandonnant les plus
+    anciennes (comptées dans ``dropped``).
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                 buffer=LOG_FILE_BUFFER):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._lines = deque(maxlen=buffer)
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._file = None
+        self._thread = None
+
+    def write(self, line):
+        with self._flushed:
+            if len(self._lines) == self._lines.maxlen:
+                # La ligne la plus ancienne est remplacée : rien de plus en attente
+                self.dropped += 1
+            else:
+                self._pending += 1
+            self._lines.append(line)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._flushed.notify_all()
+
+    def flush(self, timeout=2.0):
+        """Attend que les lignes en attente soient écrites ; True si c'est le cas."""
+        end = time.monotonic() + timeout
+        with self._flushed:
+            while self._pending:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._flushed:
+                while not self._lines:
+                    self._flushed.wait()
+                lines = [self._lines.popleft() for _ in range(min(LOG_BATCH, len(self._lines)))]
+            self._write_batch(lines)
+            with self._flushed:
+                self._pending -= len(lines)
+                self._flushed.notify_all()
+
+    def _write_batch(self, lines):
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write("".join(line + "\n" for line in lines))
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class LogPipeline:
+    """Lignes de journal produites par n'importe quel thread.
+
+    ``push`` est non bloquant : la ligne est écrite dans le fichier tournant
+    et mise en file pour l'interface, qui la retire par lots avec ``drain``.
+    La file de l'interface est bornée à ``buffer`` entrées : si l'interface
+    ne suit pas, les plus anciennes sont abandonnées (le fichier les garde).
+    """
+
+    def __init__(self, sink=None, buffer=LOG_UI_BUFFER):
+        self.sink = sink if sink is not None else RotatingFileSink()
+        self._lines = deque(maxlen=buffer)
+
+    def push(self, texte):
+        stamped = f"{time.strftime('%H:%M:%S')} {texte}"
+        for line in stamped.splitlines() or [""]:
+            self.sink.write(line)
+        # append et popleft sont atomiques : pas de verrou nécessaire
+        self._lines.append(texte)
+
+    def drain(self, limit=LOG_BATCH):
+        """Retire et retourne jusqu'à ``limit`` lignes en attente."""
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._lines.popleft())
+            except IndexError:
+                break
+        return batch
+
+    def pending(self):
+        return bool(self._lines)
@@ -1,29 +1,34 @@
 # -*- coding: utf-8 -*-
-"""Fonctions réseau pour l'application VPNBook GUI."""
+"""Fonctions réseau pour l'application VPNBook GUI.
 
+Les bibliothèques lourdes (requests, cloudscraper, Pillow, bs4) et la session
+HTTP ne sont chargées qu'au premier usage, pour ne pas retarder l'affichage
+de la fenêtre.
+"""
+
+import codecs
+import hashlib
+import json
+import os
 import time
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
 from io import BytesIO
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
 
-import requests
-from PIL import Image, ImageTk
-from bs4 import BeautifulSoup
-from tkinter import messagebox
-
-from constants import PAGE_URL
-
-try:
-    import cloudscraper
-    _HAS_CF = True
-except Exception:  # pragma: no cover - dépendance optionnelle
-    _HAS_CF = False
-
+from constants import PAGE_URL, URL_PATTERNS_FILE, COOKIES_FILE, HTTP_CACHE_DIR
+from timing import span
 
 def make_session():
     """Crée une session HTTP adaptée à VPNBook."""
-    if _HAS_CF:
+    try:
+        import cloudscraper
         s = cloudscraper.create_scraper()
-    else:
+    except Exception:  # pragma: no cover - dépendance optionnelle
+        import requests
         s = requests.Session()
     s.headers.update({
         "User-Agent": (
@@ -34,32 +39,301 @@ def make_session():
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         "Accept-Language": "fr,fr-FR;q=0.9,en-US;q=0.8,en;q=0.7",
     })
+    load_cookies(s)
     return s
 
 
-SESSION = make_session()
+def load_cookies(session, path=COOKIES_FILE):
+    """Recharge les cookies non expirés (dont l'autorisation Cloudflare).
+
+    Retourne le nombre de cookies restaurés.
+    """
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    from requests.cookies import create_cookie
+
+    now = time.time()
+    count = 0
+    for c in stored if isinstance(stored, list) else []:
+        try:
+            if c.get("expires") is not None and c["expires"] <= now:
+                continue
+            session.cookies.set_cookie(create_cookie(
+                name=c["name"],
+                value=c["value"],
+                domain=c.get("domain", ""),
+                path=c.get("path", "/"),
+                expires=c.get("expires"),
+                secure=bool(c.get("secure")),
+            ))
+            count += 1
+        except (AttributeError, KeyError, TypeError):
+            continue
+    return count
+
+
+def save_cookies(session, path=COOKIES_FILE):
+    """Enregistre les cookies de la session avec leur date d'expiration."""
+    stored = [
+        {
+            "name": c.name,
+            "value": c.value,
+            "domain": c.domain,
+            "path": c.path,
+            "expires": c.expires,
+            "secure": c.secure,
+        }
+        for c in session.cookies
+    ]
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(stored, f)
+    except OSError:
+        pass
+
+
+def clear_cookies(session, path=COOKIES_FILE):
+    """Oublie les cookies de la session et ceux enregistrés sur disque."""
+    session.cookies.clear()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_session = None
+_session_lock = threading.Lock()
 TIMEOUT = 12
 
+# Nombre d'URLs candidates de l'image téléchargées en parallèle (1 = une par
+# une). Dans tous les cas, la recherche complète est bornée par TIMEOUT.
+RACE_WIDTH = 4
+# Analyse de la page au fil du téléchargement (False = BeautifulSoup seul)
+STREAM_PARSE = True
+# Avance donnée au motif d'URL qui a fonctionné la dernière fois avant de
+# lancer les autres candidates (s)
+HEAD_START = 2.0
+
+# Scores des motifs d'URL de l'image : motif -> score (plus grand = essayé
+# plus tôt). Chargés depuis URL_PATTERNS_FILE au premier usage.
+_url_patterns = None
+_patterns_dirty = False
+_patterns_lock = threading.Lock()
+
+# Images déjà décodées : clé de cache -> (ETag, Last-Modified, image)
+_decoded_images = {}
+_decoded_lock = threading.Lock()
+
+
+def get_session():
+    """Retourne la session HTTP partagée, créée au premier appel."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = make_session()
+    return _session
+
+
+def _cache_policy(headers):
+    """Interprète Cache-Control/Expires : retourne (no_store, no_cache, max_age)."""
+    directives = {}
+    for part in (headers.get("Cache-Control") or "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip().strip('"')
+    no_store = "no-store" in directives
+    no_cache = "no-cache" in directives
+    max_age = None
+    if "max-age" in directives:
+        try:
+            max_age = max(0, int(directives["max-age"]))
+        except ValueError:
+            max_age = 0
+    elif headers.get("Expires"):
+        try:
+            max_age = max(0, int(parsedate_to_datetime(headers["Expires"]).timestamp() - time.time()))
+        except (TypeError, ValueError, OverflowError):
+            max_age = 0
+    return no_store, no_cache, max_age
+
+
+class HttpCache:
+    """Cache HTTP sur disque honorant ETag/Last-Modified et Cache-Control.
+
+    Chaque entrée se compose d'un fichier de métadonnées JSON (validateurs,
+    fraîcheur, données dérivées du corps) et, si besoin, du corps brut.
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR):
+        self.directory = directory
+
+    def _paths(self, key):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + ".json", base + ".body"
+
+    def get(self, key):
+        """Retourne les métadonnées de l'entrée, ou None."""
+        meta_path, _ = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def body(self, key):
+        """Retourne le corps enregistré de l'entrée, ou None."""
+        _, body_path = self._paths(key)
+        try:
+            with open(body_path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def is_fresh(entry):
+        """Vrai si l'entrée peut être servie sans contacter le serveur."""
+        if entry.get("no_cache") or entry.get("max_age") is None:
+            return False
+        return time.time() - entry.get("stored_at", 0) < entry["max_age"]
+
+    @staticmethod
+    def validators(entry):
+        """En-têtes de requête conditionnelle pour revalider l'entrée."""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _write(self, key, entry, body=None):
+        meta_path, body_path = self._paths(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if body is not None:
+                with open(body_path + ".tmp", "wb") as f:
+                    f.write(body)
+                os.replace(body_path + ".tmp", body_path)
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        except OSError:
+            pass
+
+    def store(self, key, response, body=None, extra=None):
+        """Enregistre une réponse 200 si ses en-têtes le permettent.
+
+        ``extra`` permet de conserver des données déjà extraites du corps
+        pour ne pas avoir à le relire lors d'une revalidation.
+        """
+        no_store, no_cache, max_age = _cache_policy(response.headers)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if no_store or not (etag or last_modified or max_age):
+            self.drop(key)
+            return
+        self._write(key, {
+            "url": response.url,
+            "stored_at": time.time(),
+            "max_age": max_age,
+            "no_cache": no_cache,
+            "etag": etag,
+            "last_modified": last_modified,
+            "extra": extra,
+        }, body)
+
+    def refresh(self, key, entry, response):
+        """Met à jour une entrée revalidée par une réponse 304."""
+        no_store, no_cache, max_age = _cache_policy(response.headers)
+        if no_store:
+            self.drop(key)
+            return
+        entry = dict(entry, stored_at=time.time(), no_cache=no_cache)
+        if max_age is not None or "Cache-Control" in response.headers:
+            entry["max_age"] = max_age
+        for header, field in (("ETag", "etag"), ("Last-Modified", "last_modified")):
+            if response.headers.get(header):
+                entry[field] = response.headers[header]
+        self._write(key, entry)
+
+    def drop(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+HTTP_CACHE = HttpCache()
+
+
+def _cache_key(url):
+    """Clé de cache d'une URL, sans le paramètre anti-cache ``t``.
+
+    Les variantes d'URL de l'image ne diffèrent que par l'horodatage ``t`` ;
+    les regrouper permet de revalider l'image au lieu de la retélécharger.
+    """
+    parts = urlsplit(url)
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "t"])
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+def _conditional_get(url, headers=None, key=None, cache=None, revalidate=False, **kwargs):
+    """GET conditionnel via le cache HTTP.
+
+    Retourne ``(réponse, entrée)`` : la réponse est None lorsque l'entrée en
+    cache est encore fraîche ou a été revalidée par un 304 ; sinon c'est la
+    réponse du serveur, à enregistrer par l'appelant. Avec ``revalidate``,
+    l'entrée est traitée comme périmée (max-age=0) : une requête
+    conditionnelle part toujours, au pire pour un 304.
+    """
+    cache = cache or HTTP_CACHE
+    key = key or url
+    entry = cache.get(key)
+    session = get_session()
+    headers = dict(headers or session.headers)
+    if entry is not None:
+        if not revalidate and cache.is_fresh(entry):
+            return None, entry
+        headers.update(cache.validators(entry))
+    with span("http_get", urlsplit(url).netloc):
+        r = session.get(url, headers=headers, timeout=kwargs.pop("timeout", TIMEOUT), **kwargs)
+    if r.status_code == 304 and entry is not None:
+        r.close()
+        cache.refresh(key, entry, r)
+        return None, entry
+    return r, None
+
 
 def _ensure_dir(url: str) -> str:
     """Force le slash final pour que urljoin traite l'URL comme un répertoire."""
     return url if url.endswith("/") else url + "/"
 
 
-def _get_base_href(soup: BeautifulSoup, fallback_url: str) -> str:
+def _get_base_href(soup, fallback_url: str) -> str:
     """Retourne la base utilisée pour résoudre les URLs relatives."""
     base = soup.find("base", href=True)
     if base and base["href"].strip():
-        return _ensure_dir(base["href"].strip())
+        return _ensure_dir(urljoin(fallback_url, base["href"].strip()))
     return _ensure_dir(fallback_url)
 
 
-def _extract_password_paths_from_scripts(soup: BeautifulSoup):
+_PASSWORD_PATH_RE = re.compile(r"""['"]([^'"]*password\.php)['"]""", re.I)
+
+
+def _extract_password_paths_from_scripts(soup):
     """Cherche dans les <script> une mention de 'password.php'."""
     paths = []
     for sc in soup.find_all("script"):
         txt = sc.string or getattr(sc, "text", "") or ""
-        for m in re.finditer(r"""['"]([^'"]*password\.php)['"]""", txt, re.I):
+        for m in _PASSWORD_PATH_RE.finditer(txt):
             paths.append(m.group(1))
     seen = set(); out = []
     for p in paths:
@@ -68,76 +342,403 @@ def _extract_password_paths_from_scripts(soup: BeautifulSoup):
     return out
 
 
-def fetch_vpnbook_password_image():
-    """Télécharge l'image du mot de passe VPNBook et retourne un PhotoImage."""
-    from urllib.parse import urlencode, urljoin, urlsplit
+def _parse_page(html, page_url):
+    """Extrait de la page les éléments nécessaires pour trouver l'image."""
+    from bs4 import BeautifulSoup
 
-    try:
-        r = SESSION.get(PAGE_URL, timeout=TIMEOUT)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-        node = soup.select_one("img.pwdimg") or soup.select_one("img[src*='password.php']")
-        base_for_join = _get_base_href(soup, r.url)
+    soup = BeautifulSoup(html, "html.parser")
+    node = soup.select_one("img.pwdimg") or soup.select_one("img[src*='password.php']")
+    rel_paths = []
+    if node and (node.get("src") or "").strip():
+        rel_paths.append(node["src"].strip())
+    rel_paths += _extract_password_paths_from_scripts(soup)
+    bg = (node.get("data-bg") or "").strip() if node else ""
+    return {
+        "url": page_url,
+        "base": _get_base_href(soup, page_url),
+        "paths": rel_paths,
+        "bg": bg if bg.isdigit() else "",
+    }
+
+
+class _PasswordPageExtractor(HTMLParser):
+    """Extracteur incrémental : <base>, img.pwdimg et chemins des <script>.
+
+    Il est alimenté au fur et à mesure du téléchargement ; ``complete``
+    devient vrai à la fin de <body>. La lecture ne s'arrête pas à l'image :
+    les <script> qui mentionnent password.php sont souvent placés en fin de
+    page, et les candidates doivent rester celles de ``_parse_page``.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.node = None
+        self.fallback_node = None
+        self.paths = []
+        self.complete = False
+        self._script = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: (v or "") for k, v in attrs}
+        if tag == "base" and self.base is None and attrs.get("href", "").strip():
+            self.base = attrs["href"].strip()
+        elif tag == "img":
+            if "pwdimg" in attrs.get("class", "").split():
+                # Comme select_one : la première image retenue l'emporte
+                if self.node is None:
+                    self.node = attrs
+            elif self.fallback_node is None and "password.php" in attrs.get("src", ""):
+                self.fallback_node = attrs
+        elif tag == "script":
+            self._script = []
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._script is not None:
+            for m in _PASSWORD_PATH_RE.finditer("".join(self._script)):
+                self.paths.append(m.group(1))
+            self._script = None
+        elif tag in ("body", "html"):
+            # Plus aucun script de page après la fin du corps
+            self.complete = True
+
+    def info(self, page_url):
+        """Retourne les éléments extraits, au format de ``_parse_page``, ou None."""
+        node = self.node or self.fallback_node
+        if node is None and not self.paths:
+            return None
         rel_paths = []
-        if node and (node.get("src") or "").strip():
+        if node and node.get("src", "").strip():
             rel_paths.append(node["src"].strip())
-        rel_paths += _extract_password_paths_from_scripts(soup)
-        if "password.php" not in " ".join(rel_paths):
-            rel_paths.append("password.php")
         seen = set()
-        rel_paths = [p for p in rel_paths if not (p in seen or seen.add(p))]
-        bg = (node.get("data-bg") or "").strip() if node else ""
-        if not bg.isdigit():
-            bg = ""
-        t_sec = str(int(time.time()))
-        t_ms = str(int(time.time() * 1000))
-        t_ym = time.strftime("%Y%m%d%H%M")
-        qs_variants = []
-        if bg:
-            qs_variants += [
-                {"t": t_sec, "bg": bg},
-                {"t": t_ms, "bg": bg},
-                {"t": t_ym, "bg": bg},
-                {"bg": bg},
-            ]
+        rel_paths += [p for p in self.paths if not (p in seen or seen.add(p))]
+        bg = node.get("data-bg", "").strip() if node else ""
+        base = urljoin(page_url, self.base) if self.base else page_url
+        return {
+            "url": page_url,
+            "base": _ensure_dir(base),
+            "paths": rel_paths,
+            "bg": bg if bg.isdigit() else "",
+        }
+
+
+def _parse_page_stream(resp, chunk_size=8192):
+    """Analyse la page au fil du téléchargement, jusqu'à la fin de <body>.
+
+    Si l'extracteur ne trouve rien d'exploitable, la page entière est
+    analysée par BeautifulSoup (``_parse_page``).
+    """
+    extractor = _PasswordPageExtractor()
+    decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+    received = []
+    try:
+        for chunk in resp.iter_content(chunk_size):
+            text = decoder.decode(chunk)
+            received.append(text)
+            extractor.feed(text)
+            if extractor.complete:
+                break
+        else:
+            tail = decoder.decode(b"", final=True)
+            received.append(tail)
+            extractor.feed(tail)
+            extractor.close()
+    finally:
+        resp.close()
+    info = extractor.info(resp.url)
+    if info is None:
+        info = _parse_page("".join(received), resp.url)
+    return info
+
+
+def _candidate_urls(info):
+    """Construit la liste des URLs candidates de l'image.
+
+    Retourne des couples ``(motif, url)``. Le motif décrit la façon dont
+    l'URL a été construite (chemin et forme de la requête) sans les valeurs
+    qui changent d'un appel à l'autre, ce qui permet de retenir celui qui
+    fonctionne.
+    """
+    rel_paths = list(info["paths"])
+    if "password.php" not in " ".join(rel_paths):
+        rel_paths.append("password.php")
+    seen = set()
+    rel_paths = [p for p in rel_paths if not (p in seen or seen.add(p))]
+    bg = info["bg"]
+    t_sec = str(int(time.time()))
+    t_ms = str(int(time.time() * 1000))
+    t_ym = time.strftime("%Y%m%d%H%M")
+    qs_variants = []
+    if bg:
         qs_variants += [
-            {"t": t_sec},
-            {"t": t_ms},
-            {"t": t_ym},
-            {},
+            ("t_s,bg", {"t": t_sec, "bg": bg}),
+            ("t_ms,bg", {"t": t_ms, "bg": bg}),
+            ("t_ym,bg", {"t": t_ym, "bg": bg}),
+            ("bg", {"bg": bg}),
         ]
-        uniq_qs = []
-        seen_qs = set()
-        for d in qs_variants:
-            key = tuple(sorted(d.items()))
-            if key not in seen_qs:
-                uniq_qs.append(d); seen_qs.add(key)
-        urls = []
-        for rel in rel_paths:
-            for qs in uniq_qs:
-                query = ("?" + urlencode(qs)) if qs else ""
-                urls.append(urljoin(base_for_join, rel) + query)
-        origin = f"{urlsplit(r.url).scheme}://{urlsplit(r.url).netloc}/"
-        for qs in uniq_qs:
+    qs_variants += [
+        ("t_s", {"t": t_sec}),
+        ("t_ms", {"t": t_ms}),
+        ("t_ym", {"t": t_ym}),
+        ("", {}),
+    ]
+    uniq_qs = []
+    seen_qs = set()
+    for kind, d in qs_variants:
+        key = tuple(sorted(d.items()))
+        if key not in seen_qs:
+            uniq_qs.append((kind, d)); seen_qs.add(key)
+    candidates = []
+    for rel in rel_paths:
+        for kind, qs in uniq_qs:
             query = ("?" + urlencode(qs)) if qs else ""
-            urls.append(urljoin(origin, "password.php") + query)
-        seen = set()
-        urls = [u for u in urls if not (u in seen or seen.add(u))]
-        headers = SESSION.headers.copy()
-        headers["Accept"] = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
-        headers["Referer"] = PAGE_URL
-        last_err = None
-        for u in urls:
+            candidates.append((f"{rel}|{kind}", urljoin(info["base"], rel) + query))
+    origin = f"{urlsplit(info['url']).scheme}://{urlsplit(info['url']).netloc}/"
+    for kind, qs in uniq_qs:
+        query = ("?" + urlencode(qs)) if qs else ""
+        candidates.append((f"/password.php|{kind}", urljoin(origin, "password.php") + query))
+    seen = set()
+    return [c for c in candidates if not (c[1] in seen or seen.add(c[1]))]
+
+
+def _load_url_patterns():
+    global _url_patterns
+    if _url_patterns is None:
+        _url_patterns = {}
+        if os.path.exists(URL_PATTERNS_FILE):
             try:
-                resp = SESSION.get(u, headers=headers, timeout=TIMEOUT)
-                resp.raise_for_status()
-                data = resp.content
-                img = Image.open(BytesIO(data))
-                return ImageTk.PhotoImage(img)
-            except Exception as ex:  # pragma: no cover - tentative jusqu'au succès
-                last_err = ex
-                continue
-        raise RuntimeError(f"Aucune URL candidate valide. Dernière erreur: {last_err}")
-    except Exception:
-        messagebox.showerror("Erreur", "Impossible de récupérer l'image du mot de passe.")
-        return None
+                with open(URL_PATTERNS_FILE, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                _url_patterns = {str(k): int(v) for k, v in data.items()}
+            except (OSError, ValueError, AttributeError):
+                pass
+    return _url_patterns
+
+
+def _order_candidates(candidates):
+    """Trie les candidates par score décroissant (ordre d'origine sinon)."""
+    with _patterns_lock:
+        scores = dict(_load_url_patterns())
+    return sorted(candidates, key=lambda c: -scores.get(c[0], 0))
+
+
+def _record_pattern(pattern, success):
+    """Promeut un motif qui a fonctionné, rétrograde un motif en échec.
+
+    Le score n'est modifié qu'en mémoire ; ``_save_url_patterns`` l'écrit.
+    """
+    global _patterns_dirty
+    with _patterns_lock:
+        scores = _load_url_patterns()
+        score = scores.get(pattern, 0)
+        scores[pattern] = min(10, max(score, 0) + 1) if success else max(-5, score - 1)
+        _patterns_dirty = True
+
+
+def _save_url_patterns():
+    """Écrit les scores des motifs s'ils ont changé (écriture atomique)."""
+    global _patterns_dirty
+    with _patterns_lock:
+        if not _patterns_dirty:
+            return
+        data = json.dumps(_url_patterns)
+        _patterns_dirty = False
+    tmp = URL_PATTERNS_FILE + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, URL_PATTERNS_FILE)
+    except OSError:
+        pass
+
+
+def _best_known(candidates):
+    """Retourne True si la première candidate a déjà fonctionné."""
+    with _patterns_lock:
+        return bool(candidates) and _load_url_patterns().get(candidates[0][0], 0) > 0
+
+
+def _fetch_image(url, headers, timeout=TIMEOUT, cancel=None):
+    """Télécharge et décode une image ; lève une exception en cas d'échec.
+
+    L'image passe par le cache HTTP : si elle n'a pas changé (entrée fraîche
+    ou réponse 304), l'image déjà décodée est réutilisée. Si ``cancel``
+    (threading.Event) est levé, le téléchargement est abandonné.
+    """
+    if cancel is not None and cancel.is_set():
+        raise RuntimeError("Téléchargement annulé")
+    key = _cache_key(url)
+    # L'image change sans que son URL change (paramètre t retiré de la clé) :
+    # ne jamais la servir du cache sans demander au serveur
+    resp, entry = _conditional_get(
+        url, headers, key=key, revalidate=True, timeout=timeout, stream=True
+    )
+    if resp is None:
+        with _decoded_lock:
+            cached = _decoded_images.get(key)
+        if cached is not None and cached[:2] == (entry.get("etag"), entry.get("last_modified")):
+            return cached[2]
+        data = HTTP_CACHE.body(key)
+        if data is None:
+            HTTP_CACHE.drop(key)
+            raise RuntimeError("Entrée de cache incomplète")
+    else:
+        with resp:
+            resp.raise_for_status()
+            chunks = []
+            for chunk in resp.iter_content(16384):
+                if cancel is not None and cancel.is_set():
+                    raise RuntimeError("Téléchargement annulé")
+                chunks.append(chunk)
+        data = b"".join(chunks)
+    from PIL import Image
+
+    img = Image.open(BytesIO(data))
+    img.load()
+    if resp is not None:
+        HTTP_CACHE.store(key, resp, body=data)
+        entry = HTTP_CACHE.get(key) or {}
+    with _decoded_lock:
+        _decoded_images[key] = (entry.get("etag"), entry.get("last_modified"), img)
+    return img
+
+
+def _race_candidates(candidates, headers, width=RACE_WIDTH, deadline=TIMEOUT, head_start=0):
+    """Essaie les URLs candidates en parallèle et retourne la première image.
+
+    Au plus ``width`` téléchargements sont actifs à la fois, dans l'ordre de
+    la liste. Dès qu'une réponse se décode comme une image, les autres sont
+    annulées. Si ``head_start`` est positif, la première candidate est
+    essayée seule pendant ce délai avant de lancer les suivantes. La
+    recherche complète ne dépasse pas ``deadline`` secondes. Le motif de la
+    candidate gagnante est promu, ceux des candidates en échec rétrogradés.
+    """
+    cancel = threading.Event()
+    end = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=max(1, min(width, len(candidates))))
+
+    def attempt(pattern, url):
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Délai global dépassé")
+        with span("image_candidate", pattern):
+            return _fetch_image(url, headers, timeout=min(TIMEOUT, remaining), cancel=cancel)
+
+    last_err = None
+    try:
+        pending = {}
+        queued = list(candidates)
+        if head_start > 0 and queued:
+            pattern, url = queued.pop(0)
+            pending[executor.submit(attempt, pattern, url)] = pattern
+            release_at = time.monotonic() + head_start
+        else:
+            release_at = None
+        while pending or queued:
+            if queued and (release_at is None or time.monotonic() >= release_at or not pending):
+                pending.update({executor.submit(attempt, p, u): p for p, u in queued})
+                queued = []
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                last_err = last_err or TimeoutError("Délai global dépassé")
+                break
+            if queued:
+                remaining = min(remaining, max(0, release_at - time.monotonic()))
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                pattern = pending.pop(future)
+                try:
+                    img = future.result()
+                except Exception as ex:  # pragma: no cover - tentative jusqu'au succès
+                    last_err = ex
+                    if not cancel.is_set():
+                        _record_pattern(pattern, False)
+                    continue
+                _record_pattern(pattern, True)
+                return img
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    raise RuntimeError(f"Aucune URL candidate valide. Dernière erreur: {last_err}")
+
+
+def _get_page_info(page_url=PAGE_URL, revalidate=False):
+    """Retourne les éléments de la page VPNBook utiles à la recherche de l'image.
+
+    La page est analysée au fil de son téléchargement (STREAM_PARSE). Elle
+    passe par le cache HTTP : si elle n'a pas changé, les éléments extraits
+    lors du précédent téléchargement sont réutilisés sans analyse.
+    Les cookies enregistrés sont réutilisés ; si la page est refusée alors
+    que des cookies étaient présents, ils sont considérés comme rejetés :
+    ils sont oubliés et la requête est refaite avec une session vierge, qui
+    repasse le défi anti-robot.
+    """
+    session = get_session()
+    r, entry = _conditional_get(page_url, revalidate=revalidate, stream=STREAM_PARSE)
+    if r is not None and r.status_code in (403, 429, 503) and len(session.cookies):
+        r.close()
+        clear_cookies(session)
+        r, entry = _conditional_get(page_url, revalidate=revalidate, stream=STREAM_PARSE)
+    if r is None:
+        info = (entry.get("extra") or {}).get("info")
+        if info:
+            return info
+        HTTP_CACHE.drop(page_url)
+        r = session.get(page_url, timeout=TIMEOUT, stream=STREAM_PARSE)
+    if not r.ok:
+        r.close()
+    r.raise_for_status()
+    save_cookies(session)
+    if STREAM_PARSE:
+        info = _parse_page_stream(r)
+    else:
+        info = _parse_page(r.text, r.url)
+    HTTP_CACHE.store(page_url, r, extra={"info": info})
+    return info
+
+
+def fetch_vpnbook_password_image(page_url=PAGE_URL, revalidate=False):
+    """Télécharge l'image du mot de passe VPNBook et retourne une image PIL.
+
+    Les URLs candidates sont essayées dans l'ordre appris lors des appels
+    précédents : dans le cas courant, une seule requête d'image suffit.
+    Appelée hors du thread Tk, la fonction ne touche pas à l'interface : la
+    conversion en PhotoImage et l'affichage des erreurs reviennent à
+    l'appelant. Lève une exception si aucune image n'a pu être obtenue.
+    L'image est toujours revalidée auprès du serveur ; ``revalidate``
+    (rafraîchissement demandé par l'utilisateur) revalide aussi la page.
+    """
+    with span("password_page"):
+        info = _get_page_info(page_url, revalidate=revalidate)
+    candidates = _order_candidates(_candidate_urls(info))
+    headers = get_session().headers.copy()
+    headers["Accept"] = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+    headers["Referer"] = page_url
+    head_start = HEAD_START if _best_known(candidates) else 0
+    try:
+        if RACE_WIDTH > 1:
+            return _race_candidates(candidates, headers, head_start=head_start)
+        return _try_candidates(candidates, headers)
+    finally:
+        # Une seule écriture des scores par téléchargement
+        _save_url_patterns()
+
+
+def _try_candidates(candidates, headers):
+    """Essaie les candidates une à une ; retourne la première image obtenue."""
+    last_err = None
+    for pattern, u in candidates:
+        try:
+            with span("image_candidate", pattern):
+                img = _fetch_image(u, headers)
+        except Exception as ex:  # pragma: no cover - tentative jusqu'au succès
+            last_err = ex
+            _record_pattern(pattern, False)
+            continue
+        _record_pattern(pattern, True)
+        return img
+    raise RuntimeError(f"Aucune URL candidate valide. Dernière erreur: {last_err}")
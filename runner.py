@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Processus de commandes persistant pour les opérations sur les profils VPN."""
+
+import queue
+import subprocess
+import threading
+import uuid
+from abc import ABC, abstractmethod
+
+
+class RunnerCrashed(OSError):
+    """Le processus de commandes s'est arrêté pendant une commande.
+
+    ``delivered`` indique si la commande avait déjà été transmise : elle a
+    alors pu s'exécuter en partie et ne doit pas être relancée.
+    """
+
+    def __init__(self, message, delivered=False):
+        super().__init__(message)
+        self.delivered = delivered
+
+
+class CommandRunner(ABC):
+    """Shell de longue durée auquel les commandes sont envoyées une à une.
+
+    Chaque commande est suivie d'un marqueur de fin unique qui porte son code
+    de retour : la sortie est lue jusqu'à ce marqueur. Le processus n'est
+    lancé qu'une fois puis réutilisé ; s'il s'était arrêté avant que la
+    commande ne lui soit transmise, il est relancé et la commande est
+    envoyée une seconde fois. Les sous-classes définissent la commande
+    de lancement et la façon d'encadrer une commande.
+    """
+
+    argv = ()
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def wrap(self, command, marker):
+        """Retourne le texte à envoyer pour exécuter ``command``."""
+
+    def run(self, command, timeout=None):
+        """Exécute une commande et retourne sa sortie (stdout et stderr).
+
+        Lève subprocess.CalledProcessError si le code de retour est non nul,
+        comme subprocess.check_output, et subprocess.TimeoutExpired si la
+        commande ne se termine pas à temps (le processus est alors relancé).
+        Lève RunnerCrashed si le processus s'arrête : avec ``delivered`` vrai,
+        la commande a pu s'exécuter et n'a pas été rejouée.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            try:
+                returncode, output = self._run_once(command, timeout)
+            except RunnerCrashed as ex:
+                if ex.delivered:
+                    raise
+                returncode, output = self._run_once(command, timeout)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command, output)
+        return output
+
+    def close(self):
+        """Arrête le processus de commandes."""
+        with self._lock:
+            self._stop()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            list(self.argv),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._read, args=(self._proc.stdout, self._lines), daemon=True
+        ).start()
+
+    @staticmethod
+    def _read(stream, lines):
+        for line in stream:
+            lines.put(line)
+        lines.put(None)
+
+    def _stop(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    def _run_once(self, command, timeout):
+        if self._proc is None or self._proc.poll() is not None:
+            self._start()
+        marker = f"__FIN_{uuid.uuid4().hex}__"
+        try:
+            self._proc.stdin.write(self.wrap(command, marker))
+            self._proc.stdin.flush()
+        except OSError as ex:
+            self._stop()
+            raise RunnerCrashed(str(ex)) from ex
+        output = []
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                self._stop()
+                raise subprocess.TimeoutExpired(command, timeout, "".join(output))
+            if line is None:
+                self._stop()
+                raise RunnerCrashed("Le processus de commandes s'est arrêté", delivered=True)
+            if line.startswith(marker):
+                try:
+                    returncode = int(line[len(marker) + 1:].strip() or 0)
+                except ValueError:
+                    returncode = 1
+                text = "".join(output)
+                # Retirer le saut de ligne inséré avant le marqueur
+                return returncode, text[:-1] if text.endswith("\n") else text
+            output.append(line)
+
+
+class PowerShellRunner(CommandRunner):
+    """Session PowerShell persistante lisant ses commandes sur l'entrée standard."""
+
+    argv = ("powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-Command", "-")
+
+    def wrap(self, command, marker):
+        # Une seule ligne : PowerShell exécute chaque ligne lue séparément
+        return (
+            f"$__rc = 0; try {{ {command}; if (-not $?) {{ $__rc = 1 }} }} "
+            f"catch {{ Write-Output $_; $__rc = 1 }}; "
+            f"[Console]::Out.WriteLine(\"`n{marker}:$__rc\"); [Console]::Out.Flush()\n"
+        )
+
+
+class PosixShellRunner(CommandRunner):
+    """Shell POSIX persistant, utilisable comme substitut sous Linux."""
+
+    argv = ("/bin/sh",)
+
+    def wrap(self, command, marker):
+        return f"{command}\nprintf '\\n%s:%s\\n' '{marker}' \"$?\"\n"
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Score des serveurs : latence mesurée et historique des connexions."""
+
+import json
+import os
+import threading
+import time
+
+from constants import DIAL_HISTORY_FILE
+
+# Poids des anciennes tentatives à chaque nouvelle tentative : un serveur
+# qui échouait autrefois peut regagner sa place
+HISTORY_DECAY = 0.9
+# Équivalence entre le temps d'établissement (ms) et la latence (ms) dans le
+# score : 10 s de connexion pèsent comme 100 ms de latence
+CONNECT_WEIGHT = 0.01
+# Lissage de la moyenne mobile du temps d'établissement
+CONNECT_ALPHA = 0.3
+
+
+class DialHistory:
+    """Tentatives de connexion par serveur : succès, erreurs et durée.
+
+    Les compteurs sont amortis à chaque tentative (HISTORY_DECAY) pour que
+    l'historique récent compte davantage que l'ancien.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, ok, duration_ms=None, code=None):
+        """Enregistre une tentative vers ``host`` et retourne son entrée.
+
+        ``code`` est la classe d'erreur rasdial ("807", "619" ou "autre")
+        en cas d'échec ; ``duration_ms`` la durée de la composition.
+        """
+        with self._lock:
+            entry = self._entries.setdefault(
+                host, {"attempts": 0.0, "successes": 0.0, "errors": {}, "connect_ms": None}
+            )
+            entry["attempts"] = entry["attempts"] * HISTORY_DECAY + 1
+            entry["successes"] *= HISTORY_DECAY
+            for key in entry["errors"]:
+                entry["errors"][key] *= HISTORY_DECAY
+            if ok:
+                entry["successes"] += 1
+                if duration_ms is not None:
+                    if entry["connect_ms"] is None:
+                        entry["connect_ms"] = float(duration_ms)
+                    else:
+                        entry["connect_ms"] += CONNECT_ALPHA * (duration_ms - entry["connect_ms"])
+            else:
+                key = code or "autre"
+                entry["errors"][key] = entry["errors"].get(key, 0.0) + 1
+            entry["updated_at"] = time.time()
+            return dict(entry)
+
+    def get(self, host):
+        """Entrée de ``host`` (copie), ou None s'il n'a jamais été composé."""
+        with self._lock:
+            entry = self._entries.get(host)
+            return dict(entry) if entry is not None else None
+
+    def load(self, path=DIAL_HISTORY_FILE):
+        """Charge l'historique d'une exécution précédente ; True si lu."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            servers = data.get("servers", {}).items()
+        except (OSError, ValueError, AttributeError):
+            return False
+        entries = {}
+        for host, entry in servers:
+            entry = _normaliser_entree(entry)
+            if entry is not None:
+                entries[host] = entry
+        with self._lock:
+            self._entries.update(entries)
+        return True
+
+    def save(self, path=DIAL_HISTORY_FILE):
+        """Écrit l'historique sur disque (écriture atomique)."""
+        with self._lock:
+            data = json.dumps({"servers": self._entries})
+            tmp = path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+
+
+def _normaliser_entree(entry):
+    """Entrée relue du fichier, complétée et typée ; None si invalide."""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        errors = entry.get("errors") or {}
+        normalisee = {
+            "attempts": float(entry.get("attempts") or 0.0),
+            "successes": float(entry.get("successes") or 0.0),
+            "errors": {str(code): float(n) for code, n in errors.items()},
+            "connect_ms": None,
+        }
+        if entry.get("connect_ms") is not None:
+            normalisee["connect_ms"] = float(entry["connect_ms"])
+        if entry.get("updated_at") is not None:
+            normalisee["updated_at"] = float(entry["updated_at"])
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return normalisee
+
+
+HISTORY = DialHistory()
+
+
+def success_rate(entry):
+    """Taux de succès estimé, optimiste pour un serveur jamais composé.
+
+    (succès + 1) / (tentatives + 1) : 1 sans historique, 0,5 après un échec,
+    puis tend vers le taux observé.
+    """
+    if not entry:
+        return 1.0
+    return (entry.get("successes", 0.0) + 1) / (entry.get("attempts", 0.0) + 1)
+
+
+def score_server(stats, entry=None):
+    """Score d'un serveur (plus petit = meilleur), ou None sans mesure.
+
+    Le score de latence (moyenne mobile, gigue, pertes) est complété par le
+    temps d'établissement moyen, puis divisé par le taux de succès : il
+    estime le coût pour obtenir un tunnel qui fonctionne, en comptant les
+    tentatives perdues sur les serveurs qui refusent souvent la connexion.
+    """
+    latency = stats.score() if stats is not None else None
+    if latency is None:
+        return None
+    connect_ms = (entry or {}).get("connect_ms") or 0.0
+    return (latency + CONNECT_WEIGHT * connect_ms) / success_rate(entry)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Exécution centralisée des tâches de fond : pool borné, dédoublonnage, annulation."""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, wait
+
+# Nombre maximal de tâches exécutées simultanément
+TASK_WORKERS = 8
+
+
+class CancelToken:
+    """Jeton d'annulation consulté par une tâche en cours d'exécution."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """Attend ``timeout`` secondes ; retourne True si la tâche est annulée."""
+        return self._event.wait(timeout)
+
+
+class Task:
+    """Tâche soumise : sa clé, son jeton d'annulation et son résultat futur."""
+
+    def __init__(self, key, token, future):
+        self.key = key
+        self.token = token
+        self.future = future
+
+    def cancel(self):
+        """Demande l'arrêt : annule la tâche si elle n'a pas démarré, sinon
+        positionne son jeton."""
+        self.token.cancel()
+        self.future.cancel()
+
+    def done(self):
+        return self.future.done()
+
+
+class TaskScheduler:
+    """Pool de threads borné où chaque tâche est identifiée par une clé.
+
+    Soumettre une clé déjà en cours retourne la tâche existante au lieu d'en
+    lancer une seconde (double clic, demandes répétées). La fonction reçoit
+    un CancelToken en premier argument et doit le consulter régulièrement
+    si elle dure longtemps. Une exception non rattrapée par la tâche est
+    transmise à ``on_error(clé, exception)``.
+
+    Les threads du pool sont des démons : une tâche bloquée (course,
+    balayage) n'empêche pas le processus de se terminer après shutdown.
+    """
+
+    def __init__(self, max_workers=TASK_WORKERS, on_error=None):
+        self._max_workers = max_workers
+        self._on_error = on_error
+        self._work = queue.Queue()
+        self._workers = 0
+        self._idle = 0
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Lance ``fn(token, *args, **kwargs)`` sous la clé ``key``.
+
+        Retourne la Task en cours pour cette clé si elle existe et n'a pas
+        été annulée, sinon une nouvelle Task ; None après shutdown.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            task = self._tasks.get(key)
+            if task is not None and not task.done() and not task.token.cancelled:
+                return task
+            task = Task(key, CancelToken(), Future())
+            self._tasks[key] = task
+            if not self._idle and self._workers < self._max_workers:
+                self._workers += 1
+                threading.Thread(target=self._worker, daemon=True).start()
+        task.future.add_done_callback(lambda _: self._finished(task))
+        self._work.put((task, fn, args, kwargs))
+        return task
+
+    def cancel(self, key):
+        """Annule la tâche en cours pour ``key`` ; True s'il y en avait une."""
+        with self._lock:
+            task = self._tasks.pop(key, None)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def shutdown(self, timeout=2.0):
+        """Annule toutes les tâches et attend leur fin au plus ``timeout`` s.
+
+        Retourne True si toutes les tâches se sont terminées à temps.
+        """
+        with self._lock:
+            self._closed = True
+            tasks = list(self._tasks.values())
+            self._tasks.clear()
+            workers = self._workers
+        for task in tasks:
+            task.cancel()
+        for _ in range(workers):
+            self._work.put(None)
+        end = time.monotonic() + timeout
+        _, not_done = wait([t.future for t in tasks], timeout=max(0.0, end - time.monotonic()))
+        return not not_done
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._work.get()
+            with self._lock:
+                self._idle -= 1
+            if item is None:
+                return
+            task, fn, args, kwargs = item
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(task.token, *args, **kwargs)
+            except BaseException as ex:
+                task.future.set_exception(ex)
+            else:
+                task.future.set_result(result)
+
+    def _finished(self, task):
+        with self._lock:
+            if self._tasks.get(task.key) is task:
+                del self._tasks[task.key]
+        if task.future.cancelled():
+            return
+        ex = task.future.exception()
+        if ex is not None and self._on_error is not None:
+            self._on_error(task.key, ex)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Mesure de la durée des étapes de connexion, export JSON lines et Prometheus."""
+
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from constants import TIMINGS_FILE, TIMINGS_PROM_FILE
+from logs import RotatingFileSink
+
+# Durées conservées par couple (étape, serveur) pour les percentiles
+TIMING_WINDOW = 512
+# Percentiles exportés dans l'instantané Prometheus
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _percentile(values, q):
+    """Percentile par rang le plus proche (``values`` triées)."""
+    rank = max(1, math.ceil(q * len(values)))
+    return values[rank - 1]
+
+
+class _Serie:
+    __slots__ = ("durations", "count", "total")
+
+    def __init__(self):
+        self.durations = deque(maxlen=TIMING_WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, ms):
+        self.durations.append(ms)
+        self.count += 1
+        self.total += ms
+
+
+class Timings:
+    """Durées des étapes, agrégées par étape et par serveur.
+
+    Chaque mesure est ajoutée à un fichier JSON lines tournant ; ``load``
+    relit ce fichier pour que les percentiles portent sur plusieurs
+    exécutions. Les mesures prises dans un ``run()`` partagent un
+    identifiant d'exécution, ce qui relie les appels rasdial ou PowerShell à
+    la connexion qui les a déclenchés ; un thread lancé par cette
+    connexion reprend l'identifiant avec ``run(current_run())``.
+    """
+
+    def __init__(self, path=TIMINGS_FILE):
+        self.path = path
+        self._series = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._runs = itertools.count(1)
+        self._sink = None
+
+    @contextmanager
+    def run(self, run_id=None):
+        """Regroupe les mesures du thread courant sous un même identifiant.
+
+        ``run_id`` reprend une exécution commencée sur un autre thread ; à
+        défaut, un nouvel identifiant est attribué.
+        """
+        previous = getattr(self._local, "run", None)
+        self._local.run = run_id or f"{os.getpid()}-{next(self._runs)}"
+        try:
+            yield self._local.run
+        finally:
+            self._local.run = previous
+
+    def current_run(self):
+        """Identifiant de l'exécution du thread courant, ou None."""
+        return getattr(self._local, "run", None)
+
+    @contextmanager
+    def span(self, phase, server=None, profile=None):
+        """Mesure la durée du bloc ; une exception le marque en échec.
+
+        ``server`` est l'hôte, utilisé pour l'agrégation ; ``profile`` (nom
+        du profil VPN) n'est conservé que dans le fichier JSON lines.
+        """
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.record(phase, (time.perf_counter() - start) * 1000, server, ok, profile)
+
+    def record(self, phase, ms, server=None, ok=True, profile=None):
+        """Enregistre une durée mesurée ailleurs (en ms)."""
+        with self._lock:
+            for key in ((phase, None), (phase, server)):
+                serie = self._series.get(key)
+                if serie is None:
+                    serie = self._series[key] = _Serie()
+                serie.add(ms)
+                if server is None:
+                    break
+            if self._sink is None:
+                self._sink = RotatingFileSink(self.path)
+        self._sink.write(json.dumps({
+            "ts": round(time.time(), 3),
+            "run": getattr(self._local, "run", None),
+            "phase": phase,
+            "server": server,
+            "profile": profile,
+            "ms": round(ms, 2),
+            "ok": ok,
+        }))
+
+    def load(self, path=None):
+        """Relit les mesures des exécutions précédentes ; True si lues."""
+        path = path or self.path
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = deque(f, maxlen=TIMING_WINDOW * 8)
+        except OSError:
+            return False
+        with self._lock:
+            for line in lines:
+                try:
+                    data = json.loads(line)
+                    phase, server, ms = data["phase"], data.get("server"), float(data["ms"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                for key in ((phase, None), (phase, server)):
+                    self._series.setdefault(key, _Serie()).add(ms)
+                    if server is None:
+                        break
+        return True
+
+    def summary(self, phase, server=None):
+        """``{"count", "sum", "p50", "p90", "p99"}`` pour une étape, ou None."""
+        with self._lock:
+            serie = self._series.get((phase, server))
+            if serie is None:
+                return None
+            values = sorted(serie.durations)
+            result = {"count": serie.count, "sum": serie.total}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = _percentile(values, q)
+        return result
+
+    def prometheus_text(self):
+        """Instantané au format texte Prometheus (résumés en ms)."""
+        with self._lock:
+            series = {
+                key: (sorted(s.durations), s.count, s.total)
+                for key, s in self._series.items()
+            }
+        out = []
+        for name, per_server in (
+            ("vpnbook_phase_duration_ms", False),
+            ("vpnbook_phase_server_duration_ms", True),
+        ):
+            out.append(f"# HELP {name} Durée des étapes de connexion (ms)")
+            out.append(f"# TYPE {name} summary")
+            for (phase, server), (values, count, total) in sorted(
+                series.items(), key=lambda item: (item[0][0], item[0][1] or "")
+            ):
+                if (server is not None) != per_server:
+                    continue
+                labels = f'phase="{_escape(phase)}"'
+                if per_server:
+                    labels += f',server="{_escape(server)}"'
+                for q in QUANTILES:
+                    out.append(f'{name}{{{labels},quantile="{q}"}} {_percentile(values, q):.2f}')
+                out.append(f"{name}_sum{{{labels}}} {total:.2f}")
+                out.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path=TIMINGS_PROM_FILE):
+        """Écrit l'instantané Prometheus (écriture atomique)."""
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def flush(self, timeout=2.0):
+        """Attend l'écriture des mesures en attente dans le fichier."""
+        if self._sink is not None:
+            self._sink.flush(timeout)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+SPANS = Timings()
+span = SPANS.span
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Regroupement des mises à jour de l'interface Tk, image par image."""
+
+import itertools
+import sys
+import threading
+
+# Délai (ms) de regroupement des mises à jour : environ une image à 60 Hz
+FRAME_MS = 16
+
+
+class UiDispatcher:
+    """Exécute sur le thread Tk les mises à jour postées par les autres threads.
+
+    Rien n'est planifié tant qu'aucune mise à jour n'est postée : la boucle
+    principale n'est réveillée que lorsqu'il y a du travail. Les mises à jour
+    arrivées pendant la même image sont exécutées ensemble, dans l'ordre ; une
+    mise à jour postée avec une clé déjà en attente remplace la précédente
+    (seul le dernier état d'un widget compte). Les mises à jour sans clé,
+    souvent des boîtes de dialogue modales, passent après les autres pour
+    ne pas les retarder.
+    """
+
+    def __init__(self, root, frame_ms=FRAME_MS):
+        self._root = root
+        self._frame_ms = frame_ms
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._unique = itertools.count()
+
+    def post(self, key, callback):
+        """Planifie ``callback()`` pour la prochaine image.
+
+        ``key`` identifie la cible (par exemple un widget) ; None pour une
+        mise à jour qui ne doit jamais être fusionnée, comme une boîte de
+        dialogue.
+        """
+        if key is None:
+            key = ("unique", next(self._unique))
+        with self._lock:
+            # Une clé déjà présente est déplacée en fin d'ordre d'exécution
+            self._pending.pop(key, None)
+            self._pending[key] = callback
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._root.after(self._frame_ms, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        ordered = sorted(pending.items(), key=lambda item: _is_unique(item[0]))
+        for _, callback in ordered:
+            try:
+                callback()
+            except Exception:
+                # Une mise à jour en échec ne doit pas bloquer les suivantes
+                self._root.report_callback_exception(*sys.exc_info())
+
+
+def _is_unique(key):
+    return isinstance(key, tuple) and len(key) == 2 and key[0] == "unique"
@@ -1,79 +1,523 @@
 # -*- coding: utf-8 -*-
 """Fonctions liées aux opérations VPN et à la mesure de latence."""
 
+import json
+import os
 import queue
 import re
+import socket
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-from constants import NOM_CONNEXION, IDENTIFIANT, SERVERS, SERVER_CHOICES
+import icmp
+from runner import PowerShellRunner, RunnerCrashed
+from constants import (
+    NOM_CONNEXION,
+    IDENTIFIANT,
+    PPTP_PORT,
+    SERVERS,
+    SERVER_CHOICES,
+    LATENCY_CACHE_FILE,
+    LATENCY_TTL,
+)
+from latency_stats import LatencyStats
+from scoring import HISTORY, score_server
+from timing import span
 
-# Dictionnaire pour mémoriser les latences mesurées des serveurs
+# Statistiques de latence par serveur : (pays, hôte) -> LatencyStats
 SERVER_LATENCIES = {}
+_stats_lock = threading.Lock()
+_cache_lock = threading.Lock()
 
-# File pour communiquer les mises à jour de latence entre threads
+# File pour communiquer les mises à jour de latence entre threads : chaque
+# élément est un tuple (libellé, texte affiché, score ou None)
 latency_queue = queue.Queue()
+# Fonctions appelées après chaque publication dans latency_queue
+_latency_listeners = []
 
+_LABELS = {key: label for label, key in SERVER_CHOICES.items()}
+_COUNTRIES = {host: country for country, host in SERVER_CHOICES.values()}
 
-def est_connecte():
+# Nombre maximal de mesures simultanées et durée maximale d'un balayage (s)
+PROBE_WORKERS = 32
+PROBE_DEADLINE = 6.0
+
+# Mode de mesure : "ping" (ICMP via la commande ping) ou "tcp" (poignée de
+# main TCP sur le port PPTP, sans lancer de processus)
+PROBE_MODE = "ping"
+PROBE_TIMEOUT = 5
+
+# Passe à False si le socket ICMP ne peut pas être ouvert (droits insuffisants)
+_icmp_disponible = True
+
+# Recherche « suffisamment bonne » : latence (ms) jugée satisfaisante
+GOOD_ENOUGH_MS = 80
+
+# Intervalle (s) entre deux vérifications de l'état de connexion : il double
+# tant que l'état ne change pas, jusqu'au maximum
+STATUS_MIN_INTERVAL = 2.0
+STATUS_MAX_INTERVAL = 30.0
+
+
+def _rasdial_connecte():
+    """Interroge rasdial pour savoir si la connexion VPN est active."""
     try:
-        output = subprocess.check_output(
-            'rasdial', shell=True, stderr=subprocess.STDOUT, universal_newlines=True
-        )
+        with span("rasdial_status"):
+            output = subprocess.check_output(
+                'rasdial', shell=True, stderr=subprocess.STDOUT, universal_newlines=True
+            )
+        # Les profils du pool (NOM_CONNEXION_<serveur>) sont aussi reconnus
         return NOM_CONNEXION in output
     except subprocess.CalledProcessError:
         return False
 
 
-def deconnecter_vpn():
+class ConnectionStatus:
+    """Détient l'état de connexion et le rafraîchit en arrière-plan.
+
+    Les appelants lisent la valeur en cache au lieu de lancer rasdial. Le
+    rafraîchissement ralentit tant que l'état est stable et repart au rythme
+    le plus rapide dès qu'il change ou qu'une opération l'invalide. Un
+    numéro de génération, incrémenté par ``set`` et ``invalidate``, écarte
+    le résultat d'une interrogation lancée avant ces opérations.
+    """
+
+    def __init__(self, probe=_rasdial_connecte, min_interval=STATUS_MIN_INTERVAL,
+                 max_interval=STATUS_MAX_INTERVAL):
+        self._probe = probe
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._interval = min_interval
+        self._value = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def get(self):
+        """Retourne l'état connu, en l'interrogeant s'il est inconnu."""
+        self._start()
+        with self._lock:
+            value = self._value
+        if value is None:
+            value = self.refresh()
+        return value
+
+    def refresh(self):
+        """Interroge le système et met le cache à jour.
+
+        Si l'état a été fixé ou invalidé pendant l'interrogation, le
+        résultat, périmé, n'est pas conservé.
+        """
+        with self._lock:
+            generation = self._generation
+        value = bool(self._probe())
+        with self._lock:
+            if generation != self._generation:
+                return value if self._value is None else self._value
+            if value == self._value:
+                self._interval = min(self._interval * 2, self._max_interval)
+            else:
+                self._interval = self._min_interval
+            self._value = value
+        return value
+
+    def set(self, value):
+        """Enregistre un état connu (après une connexion ou une déconnexion)."""
+        with self._lock:
+            self._value = bool(value)
+            self._generation += 1
+            self._interval = self._min_interval
+        self._wake.set()
+
+    def invalidate(self):
+        """Oublie l'état : le prochain appel à get() interrogera le système."""
+        with self._lock:
+            self._value = None
+            self._generation += 1
+            self._interval = self._min_interval
+        self._wake.set()
+
+    def refresh_soon(self):
+        """Demande une vérification rapide sans bloquer l'appelant."""
+        with self._lock:
+            self._interval = self._min_interval
+        self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                interval = self._interval
+            if self._wake.wait(interval):
+                self._wake.clear()
+                # Laisser le temps à rasdial de refléter la dernière opération
+                time.sleep(self._min_interval / 2)
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+
+STATUS = ConnectionStatus()
+
+# Profil composé lors de la dernière connexion
+_profil_actif = NOM_CONNEXION
+
+# Dernier état appliqué à chaque profil VPN : nom -> (serveur, split tunneling)
+_profile_state = {}
+# Serveur visé par chaque profil (nom -> hôte), pour étiqueter les mesures
+_profile_hosts = {}
+_profile_lock = threading.Lock()
+
+# Processus PowerShell persistant utilisé pour les profils VPN
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def set_runner(runner):
+    """Remplace le processus de commandes (par exemple par un shell de test)."""
+    global _runner
+    with _runner_lock:
+        old, _runner = _runner, runner
+    if old is not None and old is not runner:
+        old.close()
+
+
+def get_runner():
+    """Retourne le processus de commandes, créé au premier appel."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = PowerShellRunner()
+        return _runner
+
+
+def run_powershell(command):
+    """Exécute une commande PowerShell via le processus persistant.
+
+    Si le processus ne peut pas être lancé, la commande est exécutée dans un
+    processus PowerShell dédié. Lève subprocess.CalledProcessError en cas
+    d'échec, comme subprocess.check_output, subprocess.TimeoutExpired si
+    elle ne se termine pas à temps, et RunnerCrashed si le processus s'est
+    arrêté après l'avoir reçue (elle n'est alors pas relancée).
+    """
+    runner = get_runner()
     try:
-        subprocess.check_output(
-            f'rasdial "{NOM_CONNEXION}" /disconnect',
-            shell=True,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-        )
+        return runner.run(command)
+    except RunnerCrashed as ex:
+        if ex.delivered:
+            raise
+    except OSError:
+        pass
+    return subprocess.check_output(
+        f"powershell -Command \"{command}\"",
+        shell=True,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        timeout=runner.timeout,
+    )
+
+
+def est_connecte():
+    """Indique si la connexion VPN est active (valeur tenue par STATUS)."""
+    return STATUS.get()
+
+
+def classer_erreur_rasdial(output):
+    """Classe la sortie d'un échec rasdial : "807", "619" ou "autre".
+
+    807 : connexion interrompue (latence élevée ou serveur saturé) ;
+    619 : session impossible à établir (réseau, identifiants, pare-feu).
+    """
+    texte = output if isinstance(output, str) else str(output or "")
+    if "807" in texte:
+        return "807"
+    if "619" in texte:
+        return "619"
+    return "autre"
+
+
+def raccrocher_profil(nom):
+    """Raccroche un profil via rasdial, sans toucher à l'état mémorisé."""
+    try:
+        with span("rasdial_hangup", hote_profil(nom), profile=nom):
+            subprocess.check_output(
+                f'rasdial "{nom}" /disconnect',
+                shell=True,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
         return True
     except subprocess.CalledProcessError:
         return False
 
 
-def creer_ou_mettre_a_jour_vpn(ip, split_tunneling=False):
-    split_param = "$true" if split_tunneling else "$false"
-    check_cmd = f"powershell -Command \"Get-VpnConnection -Name '{NOM_CONNEXION}'\""
+def deconnecter_vpn(nom=None):
+    """Déconnecte le profil indiqué, ou à défaut le dernier profil composé."""
+    if raccrocher_profil(nom or _profil_actif):
+        STATUS.set(False)
+        return True
+    STATUS.invalidate()
+    return False
+
+
+def lire_profil_vpn(nom=NOM_CONNEXION):
+    """Lit l'état d'un profil VPN : ``(adresse du serveur, split tunneling)``.
+
+    Retourne None si le profil n'existe pas. Si PowerShell ne répond pas
+    (subprocess.TimeoutExpired, OSError), l'état est inconnu : l'exception
+    est propagée plutôt que de supposer le profil absent.
+    """
+    try:
+        with span("profile_get", hote_profil(nom), profile=nom):
+            output = run_powershell(
+                f"Get-VpnConnection -Name '{nom}' -ErrorAction Stop "
+                f"| Select-Object ServerAddress,SplitTunneling | ConvertTo-Json -Compress"
+            )
+    except subprocess.CalledProcessError:
+        return None
+    try:
+        data = json.loads(output.strip())
+        return (str(data["ServerAddress"]).lower(), bool(data["SplitTunneling"]))
+    except (ValueError, KeyError, TypeError):
+        # Profil présent mais état illisible : le considérer comme différent
+        return ("", None)
+
+
+def hote_profil(nom):
+    """Serveur vers lequel pointe un profil (dernier connu), ou None."""
+    with _profile_lock:
+        return _profile_hosts.get(nom)
+
+
+def invalider_profil(nom=NOM_CONNEXION):
+    """Oublie l'état mémorisé d'un profil (il sera relu au prochain usage)."""
+    with _profile_lock:
+        _profile_state.pop(nom, None)
+
+
+def creer_ou_mettre_a_jour_vpn(ip, split_tunneling=False, nom=NOM_CONNEXION):
+    """Crée ou met à jour le profil VPN ``nom`` pour pointer vers ``ip``.
+
+    Le dernier état appliqué est mémorisé : si le profil pointe déjà vers le
+    même serveur avec le même split tunneling, rien n'est modifié. Retourne
+    True si le profil a été créé ou modifié, False s'il était déjà à jour.
+
+    Si PowerShell ne répond pas ou s'arrête (subprocess.TimeoutExpired,
+    OSError), l'état mémorisé est oublié et l'exception propagée : la
+    commande a pu s'appliquer, le profil sera relu au prochain usage.
+    """
+    voulu = (ip.lower(), bool(split_tunneling))
+    with _profile_lock:
+        _profile_hosts[nom] = ip
+    with _profile_lock:
+        if _profile_state.get(nom) == voulu:
+            return False
     try:
-        subprocess.check_output(check_cmd, shell=True, stderr=subprocess.STDOUT)
+        return _appliquer_profil(nom, ip, voulu)
+    except (subprocess.TimeoutExpired, OSError):
+        invalider_profil(nom)
+        raise
+
+
+def _appliquer_profil(nom, ip, voulu):
+    split_tunneling = voulu[1]
+    etat = lire_profil_vpn(nom)
+    if etat == voulu:
+        with _profile_lock:
+            _profile_state[nom] = voulu
+        return False
+    split_param = "$true" if split_tunneling else "$false"
+    if etat is not None:
         set_cmd = (
-            f"powershell -Command \"Set-VpnConnection -Name '{NOM_CONNEXION}' "
-            f"-ServerAddress '{ip}' -SplitTunneling {split_param} -Force\""
+            f"Set-VpnConnection -Name '{nom}' "
+            f"-ServerAddress '{ip}' -SplitTunneling {split_param} -Force -ErrorAction Stop"
         )
-        subprocess.check_output(set_cmd, shell=True, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError:
+        try:
+            with span("profile_set", ip, profile=nom):
+                run_powershell(set_cmd)
+        except subprocess.CalledProcessError:
+            etat = None
+    if etat is None:
         add_cmd = (
-            f"powershell -Command \"Add-VpnConnection -Name '{NOM_CONNEXION}' "
+            f"Add-VpnConnection -Name '{nom}' "
             f"-ServerAddress '{ip}' -TunnelType 'Pptp' "
             f"-AuthenticationMethod 'MSChapv2' -EncryptionLevel 'Optional' "
-            f"-SplitTunneling {split_param} -Force\""
+            f"-SplitTunneling {split_param} -Force -ErrorAction Stop"
         )
-        subprocess.check_output(add_cmd, shell=True, stderr=subprocess.STDOUT)
+        with span("profile_add", ip, profile=nom):
+            run_powershell(add_cmd)
+    with _profile_lock:
+        _profile_state[nom] = voulu
+    return True
 
 
-def connecter_vpn(mot_de_passe):
-    commande_connect = f'rasdial "{NOM_CONNEXION}" {IDENTIFIANT} {mot_de_passe}'
-    subprocess.check_output(
-        commande_connect, shell=True, stderr=subprocess.STDOUT, universal_newlines=True
-    )
+def nom_profil_serveur(host):
+    """Nom du profil pré-configuré dédié à un serveur."""
+    return f"{NOM_CONNEXION}_{host.split('.')[0]}"
+
+
+class ProfilePool:
+    """Un profil VPN pré-configuré par serveur, réconcilié en arrière-plan.
+
+    Une fois un profil prêt, changer de serveur consiste à composer le profil
+    correspondant, sans modifier de profil sur le chemin de la connexion.
+    """
+
+    def __init__(self, servers=SERVER_CHOICES):
+        self._hosts = [host for _, host in servers.values()]
+        self._ready = {}  # hôte -> split tunneling appliqué
+        self._split = None
+        self._generation = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def profile_for(self, host, split_tunneling):
+        """Nom du profil prêt pour ``host`` avec ce réglage, ou None."""
+        with self._lock:
+            if self._ready.get(host) == bool(split_tunneling):
+                return nom_profil_serveur(host)
+        return None
+
+    def invalidate(self, host):
+        """Retire un profil du pool et le fait revérifier en arrière-plan."""
+        with self._lock:
+            self._ready.pop(host, None)
+            split = self._split
+        invalider_profil(nom_profil_serveur(host))
+        if split is not None:
+            self.start_reconcile(split)
+
+    def start_reconcile(self, split_tunneling):
+        """Lance (ou relance avec le nouveau réglage) la réconciliation."""
+        with self._lock:
+            self._split = bool(split_tunneling)
+            self._generation += 1
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._reconcile, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Désactive le pool : la réconciliation en cours s'arrête au
+        prochain profil et ``invalidate`` ne la relance plus."""
+        with self._lock:
+            self._split = None
+            self._generation += 1
+
+    def _reconcile(self):
+        while True:
+            with self._lock:
+                generation, split = self._generation, self._split
+                if split is None:
+                    self._thread = None
+                    return
+            for host in self._hosts:
+                with self._lock:
+                    if generation != self._generation:
+                        break
+                try:
+                    creer_ou_mettre_a_jour_vpn(host, split, nom=nom_profil_serveur(host))
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+                    with self._lock:
+                        self._ready.pop(host, None)
+                    continue
+                with self._lock:
+                    self._ready[host] = split
+            with self._lock:
+                if generation == self._generation:
+                    self._thread = None
+                    return
+
+
+POOL = ProfilePool()
+
+
+def composer_profil(nom, mot_de_passe):
+    """Compose un profil via rasdial, sans toucher à l'état mémorisé.
+
+    Lève subprocess.CalledProcessError (sortie de rasdial dans ``output``).
+    """
+    commande_connect = f'rasdial "{nom}" {IDENTIFIANT} {mot_de_passe}'
+    with span("rasdial_dial", hote_profil(nom), profile=nom):
+        subprocess.check_output(
+            commande_connect, shell=True, stderr=subprocess.STDOUT, universal_newlines=True
+        )
+
+
+def record_dial(host, ok, duration_ms=None, output=""):
+    """Enregistre le résultat d'une composition vers ``host``.
+
+    L'historique est sauvegardé et le libellé du serveur republié, pour que
+    la liste des serveurs suive le nouveau score.
+    """
+    code = None if ok else classer_erreur_rasdial(output or "")
+    HISTORY.record(host, ok, duration_ms, code)
+    HISTORY.save()
+    country = _COUNTRIES.get(host)
+    if country is not None:
+        with _stats_lock:
+            stats = SERVER_LATENCIES.get((country, host))
+        publish_latency(country, host, stats)
+
+
+def marquer_connecte(nom):
+    """Enregistre ``nom`` comme profil actif et l'état comme connecté."""
+    global _profil_actif
+    _profil_actif = nom
+    STATUS.set(True)
+
+
+def connecter_vpn(mot_de_passe, nom=NOM_CONNEXION):
+    try:
+        composer_profil(nom, mot_de_passe)
+    except subprocess.CalledProcessError:
+        STATUS.invalidate()
+        raise
+    marquer_connecte(nom)
     return True
 
 
-def measure_latency(ip):
-    """Mesure la latence vers une IP et renvoie la valeur en ms ou None."""
+def icmp_sweep(hosts, timeout=PROBE_TIMEOUT, on_result=None, stop=None):
+    """Sonde les hôtes via le moteur ICMP multiplexé, ou retourne None.
+
+    None indique que le socket ICMP n'est pas utilisable : l'appelant doit
+    alors se rabattre sur la commande ping.
+    """
+    global _icmp_disponible
+    if not _icmp_disponible:
+        return None
+    try:
+        return icmp.sweep(hosts, timeout=timeout, on_result=on_result, stop=stop)
+    except OSError:
+        _icmp_disponible = False
+        return None
+
+
+def measure_latency_ping(ip):
+    """Mesure la latence ICMP, en ms ou None.
+
+    Le moteur ICMP en processus est utilisé lorsqu'il est disponible ; à
+    défaut, la commande ping est lancée.
+    """
+    results = icmp_sweep([ip])
+    if results is not None:
+        return results[ip]
     try:
         output = subprocess.check_output(
             f'ping -n 1 {ip}',
             shell=True,
             universal_newlines=True,
             stderr=subprocess.STDOUT,
-            timeout=5,
+            timeout=PROBE_TIMEOUT,
         )
         match = re.search(r'(?:temps=|time=)\s*<?\s*(\d+)\s*ms', output, re.IGNORECASE)
         if match:
@@ -83,30 +527,341 @@ def measure_latency(ip):
     return None
 
 
-def update_server_latencies():
-    """Met à jour les latences de tous les serveurs et rafraîchit la liste."""
-    new_values = []
-    for label, (country, host) in SERVER_CHOICES.items():
-        latency = measure_latency(host)
-        SERVER_LATENCIES[(country, host)] = latency
-        new_values.append(
-            f"{country} – {host.split('.')[0]} ({latency if latency is not None else 'N/A'} ms)"
+def measure_latency_tcp(ip, port=PPTP_PORT):
+    """Mesure le temps d'établissement d'une connexion TCP, en ms ou None.
+
+    Une réponse indique aussi que le service PPTP est réellement joignable,
+    même lorsque l'ICMP est filtré.
+    """
+    try:
+        # Résolution DNS hors chronométrage, comme le fait ping
+        family, type_, proto, _, addr = socket.getaddrinfo(
+            ip, port, socket.AF_INET, socket.SOCK_STREAM
+        )[0]
+        with socket.socket(family, type_, proto) as sock:
+            sock.settimeout(PROBE_TIMEOUT)
+            start = time.perf_counter()
+            sock.connect(addr)
+    except OSError:
+        return None
+    return max(1, round((time.perf_counter() - start) * 1000))
+
+
+def measure_latency(ip, mode=None):
+    """Mesure la latence vers une IP et renvoie la valeur en ms ou None."""
+    if (mode or PROBE_MODE) == "tcp":
+        return measure_latency_tcp(ip)
+    return measure_latency_ping(ip)
+
+
+def probe_hosts(hosts, deadline=PROBE_DEADLINE, max_workers=PROBE_WORKERS, mode=None,
+                on_result=None, stop=None):
+    """Mesure la latence de plusieurs hôtes en parallèle.
+
+    Les mesures sont réparties sur un pool borné de threads et le balayage
+    complet est limité par ``deadline`` secondes : les hôtes qui n'ont pas
+    répondu à l'échéance sont renvoyés avec la valeur None. Si fourni,
+    ``on_result(hôte, latence)`` est appelé dès qu'une mesure se termine ;
+    positionner ``stop`` (threading.Event) depuis ce rappel termine le
+    balayage sans attendre les autres hôtes.
+    """
+    hosts = list(dict.fromkeys(hosts))
+    results = dict.fromkeys(hosts)
+    if not hosts:
+        return results
+    if (mode or PROBE_MODE) == "ping":
+        # Un seul socket et une seule fenêtre d'attente pour tous les hôtes
+        swept = icmp_sweep(
+            hosts, timeout=min(deadline, PROBE_TIMEOUT), on_result=on_result, stop=stop
         )
-    latency_queue.put(new_values)
+        if swept is not None:
+            return swept
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts))))
+    try:
+        pending = {executor.submit(measure_latency, host, mode): host for host in hosts}
+        end = time.monotonic() + deadline
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                host = pending.pop(future)
+                try:
+                    results[host] = future.result()
+                except Exception:
+                    results[host] = None
+                if on_result:
+                    on_result(host, results[host])
+            if stop is not None and stop.is_set():
+                break
+    finally:
+        # Les mesures encore en cours se terminent seules (timeout du ping)
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
 
 
-def find_fastest_server():
-    """Ping tous les serveurs et retourne celui avec la latence minimale."""
-    best_country = None
-    best_ip = None
-    best_latency = None
-    for country, hosts in SERVERS.items():
-        for host in hosts:
-            latency = measure_latency(host)
-            if latency is None:
+def record_latency(country, host, latency):
+    """Ajoute une mesure aux statistiques du serveur et les retourne."""
+    with _stats_lock:
+        stats = SERVER_LATENCIES.get((country, host))
+        if stats is None:
+            stats = SERVER_LATENCIES[(country, host)] = LatencyStats()
+        stats.add(latency)
+        return stats
+
+
+def record_host_latency(host, latency):
+    """Comme record_latency, en retrouvant le pays à partir de l'hôte."""
+    country = _COUNTRIES.get(host)
+    if country is None:
+        return None
+    return record_latency(country, host, latency)
+
+
+def format_server_label(label, stats):
+    """Libellé de la liste des serveurs, complété par les statistiques."""
+    if stats is None or stats.ewma is None:
+        return f"{label} (N/A ms)"
+    text = f"{label} ({stats.ewma:.0f} ± {stats.jitter:.0f} ms"
+    if stats.loss_rate:
+        text += f", {stats.loss_rate:.0%} perte"
+    return text + ")"
+
+
+def strip_server_label(text):
+    """Retire les statistiques ajoutées par format_server_label."""
+    return re.sub(r"\s*\(.*\)\s*$", "", text).strip()
+
+
+def rank_servers(results=None):
+    """Classe les serveurs selon leur score, du meilleur au moins bon.
+
+    Le score (scoring.score_server) combine les statistiques de latence et
+    l'historique des connexions. Retourne une liste de ``(pays, hôte,
+    stats)``. Si ``results`` est fourni, seuls les hôtes ayant répondu à ce
+    balayage sont retenus.
+    """
+    ranked = []
+    with _stats_lock:
+        for (country, host), stats in SERVER_LATENCIES.items():
+            if results is not None and results.get(host) is None:
                 continue
-            if best_latency is None or latency < best_latency:
-                best_country = country
-                best_ip = host
-                best_latency = latency
-    return best_country, best_ip, best_latency
+            score = score_server(stats, HISTORY.get(host))
+            if score is not None:
+                ranked.append((score, country, host, stats))
+    ranked.sort(key=lambda item: item[0])
+    return [(country, host, stats) for _, country, host, stats in ranked]
+
+
+def load_latency_cache(path=LATENCY_CACHE_FILE):
+    """Charge les statistiques mémorisées lors d'une exécution précédente.
+
+    Retourne True si le cache a pu être lu. Les serveurs qui ne figurent plus
+    dans SERVER_CHOICES sont ignorés.
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get("servers", [])
+    except (OSError, ValueError, AttributeError):
+        return False
+    known = set(SERVER_CHOICES.values())
+    with _stats_lock:
+        for entry in entries:
+            try:
+                key = (entry["country"], entry["host"])
+                if key in known:
+                    SERVER_LATENCIES[key] = LatencyStats.from_dict(entry)
+            except (KeyError, TypeError, ValueError):
+                continue
+    return True
+
+
+def save_latency_cache(path=LATENCY_CACHE_FILE):
+    """Écrit les statistiques courantes sur disque (écriture atomique)."""
+    with _stats_lock:
+        entries = [
+            dict(stats.to_dict(), country=country, host=host)
+            for (country, host), stats in SERVER_LATENCIES.items()
+        ]
+    tmp = path + ".tmp"
+    with _cache_lock:
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"servers": entries}, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+def stale_hosts(ttl=LATENCY_TTL):
+    """Hôtes sans mesure ou dont la dernière mesure date de plus de ``ttl`` s."""
+    now = time.time()
+    stale = []
+    with _stats_lock:
+        for country, host in SERVER_CHOICES.values():
+            stats = SERVER_LATENCIES.get((country, host))
+            if stats is None or stats.updated_at is None or now - stats.updated_at > ttl:
+                stale.append(host)
+    return stale
+
+
+def publish_latency(country, host, stats):
+    """Transmet le libellé à jour d'un serveur à l'interface."""
+    label = _LABELS.get((country, host))
+    if label is not None:
+        score = score_server(stats, HISTORY.get(host))
+        latency_queue.put((label, format_server_label(label, stats), score))
+        for listener in list(_latency_listeners):
+            listener()
+
+
+def add_latency_listener(listener):
+    """Enregistre ``listener()``, appelé à chaque publication de latence.
+
+    Permet à l'interface de ne relire latency_queue que lorsqu'elle contient
+    quelque chose, au lieu de l'interroger à intervalle fixe.
+    """
+    _latency_listeners.append(listener)
+
+
+def publish_server_labels():
+    """Transmet à l'interface le libellé de chaque serveur connu."""
+    with _stats_lock:
+        known = list(SERVER_LATENCIES.items())
+    for (country, host), stats in known:
+        publish_latency(country, host, stats)
+
+
+def _record_and_publish(host, latency):
+    stats = record_host_latency(host, latency)
+    if stats is not None:
+        publish_latency(_COUNTRIES[host], host, stats)
+
+
+def _probe_and_publish(hosts, mode=None):
+    """Sonde les hôtes en publiant chaque résultat dès qu'il arrive."""
+    seen = set()
+
+    def on_result(host, latency):
+        seen.add(host)
+        _record_and_publish(host, latency)
+
+    results = probe_hosts(hosts, mode=mode, on_result=on_result)
+    # Hôtes toujours sans réponse à l'échéance du balayage
+    for host, latency in results.items():
+        if host not in seen:
+            _record_and_publish(host, latency)
+    save_latency_cache()
+    return results
+
+
+def update_server_latencies(mode=None, ttl=None):
+    """Met à jour les latences des serveurs et rafraîchit la liste.
+
+    Chaque résultat est publié dans latency_queue dès sa mesure. Si ``ttl``
+    est fourni, seuls les serveurs dont la mesure est plus ancienne sont
+    sondés ; les autres conservent leurs statistiques.
+    """
+    hosts = stale_hosts(ttl) if ttl is not None else [h for _, h in SERVER_CHOICES.values()]
+    if hosts:
+        _probe_and_publish(hosts, mode=mode)
+
+
+def find_fastest_servers(count, mode=None):
+    """Ping tous les serveurs et retourne les ``count`` mieux classés.
+
+    Le classement repose sur le score (statistiques de latence et historique
+    des connexions) des serveurs qui ont répondu à ce balayage. Retourne une
+    liste de ``(pays, hôte, latence)``.
+    """
+    results = _probe_and_publish((host for hosts in SERVERS.values() for host in hosts), mode=mode)
+    return [
+        (country, host, round(stats.ewma))
+        for country, host, stats in rank_servers(results)[:count]
+    ]
+
+
+def find_fastest_server(mode=None):
+    """Ping tous les serveurs et retourne le mieux classé."""
+    ranked = find_fastest_servers(1, mode=mode)
+    if not ranked:
+        return None, None, None
+    return ranked[0]
+
+
+def _search_order(hosts, preferred_country=None):
+    """Ordre de sondage : pays préféré d'abord, puis meilleurs scores connus.
+
+    Les serveurs jamais mesurés passent après ceux qui ont répondu, et ceux
+    qui n'ont jamais répondu en dernier.
+    """
+    with _stats_lock:
+        scores = {}
+        for host in hosts:
+            stats = SERVER_LATENCIES.get((_COUNTRIES.get(host), host))
+            if stats is None:
+                scores[host] = (1, 0.0)
+            elif stats.score() is None:
+                scores[host] = (2, 0.0)
+            else:
+                scores[host] = (0, score_server(stats, HISTORY.get(host)))
+    return sorted(
+        hosts,
+        key=lambda h: (_COUNTRIES.get(h) != preferred_country, scores[h]),
+    )
+
+
+def _lower_bound(host):
+    """Meilleure latence qu'un hôte peut raisonnablement atteindre (ms).
+
+    C'est le minimum historique du serveur ; 0 s'il n'a jamais été mesuré,
+    puisque rien ne permet alors de l'écarter.
+    """
+    with _stats_lock:
+        stats = SERVER_LATENCIES.get((_COUNTRIES.get(host), host))
+        minimum = stats.minimum if stats is not None else None
+    return minimum if minimum is not None else 0
+
+
+def find_good_enough_server(target_ms=GOOD_ENOUGH_MS, preferred_country=None, mode=None,
+                            deadline=PROBE_DEADLINE):
+    """Retourne le premier serveur jugé suffisamment rapide.
+
+    Tous les serveurs sont sondés en même temps, les requêtes partant dans
+    l'ordre de _search_order. La recherche s'arrête dès qu'un serveur répond
+    en moins de ``target_ms`` ms, ou quand aucun serveur encore sans réponse
+    ne peut, d'après son minimum historique, battre le meilleur trouvé ; elle
+    ne dure jamais plus de ``deadline`` secondes, quel que soit le nombre de
+    serveurs. Retourne ``(pays, hôte, latence)`` ou ``(None, None, None)``.
+    """
+    hosts = _search_order([host for _, host in SERVER_CHOICES.values()], preferred_country)
+    bounds = {host: _lower_bound(host) for host in hosts}
+    waiting = set(hosts)
+    stop = threading.Event()
+    best = None
+
+    def on_result(host, latency):
+        nonlocal best
+        waiting.discard(host)
+        _record_and_publish(host, latency)
+        if latency is not None and (best is None or latency < best[1]):
+            best = (host, latency)
+        if best is None:
+            return
+        if best[1] <= target_ms or all(bounds[h] >= best[1] for h in waiting):
+            stop.set()
+
+    results = probe_hosts(hosts, deadline=deadline, mode=mode, on_result=on_result, stop=stop)
+    if not stop.is_set():
+        # Hôtes toujours sans réponse à l'échéance : comptés comme pertes
+        for host in waiting:
+            _record_and_publish(host, results.get(host))
+    save_latency_cache()
+    if best is None:
+        return None, None, None
+    host, latency = best
+    return _COUNTRIES[host], host, latency
@@ -1,28 +1,64 @@
 # -*- coding: utf-8 -*-
 """Interface graphique moderne pour l'application VPNBook GUI."""
 
+import time
+
+# Référence pour mesurer le délai jusqu'à l'affichage de la fenêtre
+_T_DEMARRAGE = time.perf_counter()
+
 import customtkinter as ctk
 from tkinter import messagebox
 import json
 import os
 import subprocess
-import threading
+import sys
 import queue
-import time
-import re
 
-from constants import IDENTIFIANT, MDP_FILE, SERVER_CHOICES, ASCII_LOGOS
+# Modules déjà chargés par customtkinter (qui importe notamment PIL) : ils ne
+# comptent pas comme chargés trop tôt
+_MODULES_CTK = frozenset(sys.modules)
+
+from constants import (
+    NOM_CONNEXION,
+    IDENTIFIANT,
+    MDP_FILE,
+    SERVER_CHOICES,
+    ASCII_LOGOS,
+    LATENCY_TTL,
+    LOG_FILE,
+    DIAGNOSTICS_DIR,
+)
 from network import fetch_vpnbook_password_image
+from dialer import RACE_TOP_K, RaceFailed, RasdialBackend, Supervisor, race_connect
 from vpn_ops import (
     est_connecte,
     deconnecter_vpn,
     creer_ou_mettre_a_jour_vpn,
+    invalider_profil,
     connecter_vpn,
+    POOL,
     update_server_latencies,
     find_fastest_server,
+    find_fastest_servers,
+    find_good_enough_server,
+    GOOD_ENOUGH_MS,
+    classer_erreur_rasdial,
     measure_latency,
+    record_host_latency,
+    strip_server_label,
+    load_latency_cache,
+    publish_server_labels,
     latency_queue,
+    add_latency_listener,
+    record_dial,
+    STATUS,
 )
+from scoring import HISTORY
+from logs import LogPipeline
+from ui_dispatch import UiDispatcher
+from tasks import TaskScheduler
+from timing import SPANS, span
+from diagnostics import Diagnostics
 
 # Configuration du thème
 ctk.set_appearance_mode("dark")
@@ -40,8 +76,16 @@ COLORS = {
     "button_hover": "#1e5f74",
 }
 
-stop_ping_thread = False
-ping_thread = None
+# Objectif de délai entre le lancement et l'affichage de la fenêtre (ms)
+OBJECTIF_PREMIERE_IMAGE_MS = 500
+# Modules qui ne doivent pas être chargés avant l'affichage de la fenêtre
+MODULES_DIFFERES = ("requests", "cloudscraper", "bs4")
+# Nombre maximal de lignes conservées dans la zone de logs
+LOG_MAX_LINES = 1000
+# Intervalle (ms) et pas de l'animation de la barre de progression
+PROGRESS_FRAME_MS = 100
+PROGRESS_STEP = 0.04
+
 show_password = False
 
 
@@ -55,6 +99,14 @@ class VPNApp(ctk.CTk):
         self.geometry("700x850")
         self.minsize(650, 750)
 
+        # Mises à jour de l'interface regroupées par image, et logs passant
+        # par une file vidée par le même mécanisme
+        self._ui = UiDispatcher(self)
+        self._logs = LogPipeline()
+        # Toutes les tâches bloquantes passent par ce pool, une seule par clé
+        self._taches = TaskScheduler(on_error=self._sur_erreur_tache)
+        self.protocol("WM_DELETE_WINDOW", self._fermer)
+
         # Configuration de la grille principale
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(0, weight=0)  # Header
@@ -71,9 +123,41 @@ class VPNApp(ctk.CTk):
         self._create_actions_section()
         self._create_logs_section()
 
-        # Démarrer la mise à jour des latences
-        threading.Thread(target=update_server_latencies, daemon=True).start()
-        self.after(100, self._process_latency_queue)
+        # Afficher immédiatement les latences mémorisées, puis ne resonder
+        # en arrière-plan que les serveurs dont la mesure est périmée
+        HISTORY.load()
+        if load_latency_cache():
+            publish_server_labels()
+        self._taches.submit("balayage", lambda token: update_server_latencies(ttl=LATENCY_TTL))
+        # Durées des exécutions précédentes, pour des percentiles cumulés
+        self._taches.submit("mesures", lambda token: SPANS.load())
+        self._premiere_latence = None
+        # La liste n'est retriée que lorsqu'une latence est publiée
+        add_latency_listener(lambda: self._ui.post("latences", self._process_latency_queue))
+        self._ui.post("latences", self._process_latency_queue)
+
+        # Les tâches réseau lourdes attendent que la fenêtre soit affichée
+        self._premiere_image_vue = False
+        self.bind("<Map>", self._sur_affichage, add="+")
+
+    def _sur_affichage(self, event):
+        """Appelé quand la fenêtre principale est affichée pour la première fois."""
+        if event.widget is not self or self._premiere_image_vue:
+            return
+        self._premiere_image_vue = True
+        self.after_idle(self._premiere_image)
+
+    def _premiere_image(self):
+        """Mesure le délai d'affichage puis lance les tâches différées."""
+        delai_ms = (time.perf_counter() - _T_DEMARRAGE) * 1000
+        charges = [m for m in MODULES_DIFFERES if m in sys.modules and m not in _MODULES_CTK]
+        message = f"Fenêtre affichée en {delai_ms:.0f} ms (objectif {OBJECTIF_PREMIERE_IMAGE_MS} ms)."
+        if delai_ms > OBJECTIF_PREMIERE_IMAGE_MS:
+            message += " Objectif dépassé."
+        if charges:
+            message += f" Modules chargés trop tôt : {', '.join(charges)}."
+        self._ajouter_log(message)
+        self._load_password_image()
 
     def _create_header(self):
         """Crée l'en-tête de l'application."""
@@ -132,7 +216,9 @@ class VPNApp(ctk.CTk):
         )
         section_title.pack(padx=20, pady=(15, 10), anchor="w")
 
-        # Combobox serveur
+        # Combobox serveur : libellé -> (texte affiché, score) et ordre initial
+        self._server_entries = {label: (label, None) for label in SERVER_CHOICES}
+        self._server_order = {label: i for i, label in enumerate(SERVER_CHOICES)}
         self.selected_server = ctk.StringVar(value=list(SERVER_CHOICES.keys())[0])
         self.server_combobox = ctk.CTkComboBox(
             server_card,
@@ -210,8 +296,8 @@ class VPNApp(ctk.CTk):
         self.label_mdp_img = ctk.CTkLabel(pwd_frame, text="")
         self.label_mdp_img.pack(pady=8)
 
-        # Charger l'image du mot de passe
-        self._load_password_image()
+        # L'image du mot de passe est chargée une fois la fenêtre affichée
+        # (voir _premiere_image)
 
         self.entry_mdp = ctk.CTkEntry(
             pwd_frame,
@@ -279,6 +365,7 @@ class VPNApp(ctk.CTk):
             split_frame,
             text="Activer le split tunneling",
             variable=self.split_tunneling_var,
+            command=self._sur_changement_pool,
             font=ctk.CTkFont(size=13),
             corner_radius=5,
             checkbox_width=22,
@@ -295,7 +382,114 @@ class VPNApp(ctk.CTk):
             anchor="w",
             justify="left"
         )
-        split_note.pack(padx=20, pady=(0, 15), anchor="w")
+        split_note.pack(padx=20, pady=(0, 10), anchor="w")
+
+        # Mode de mesure de la latence
+        self.tcp_probe_var = ctk.BooleanVar(value=False)
+        # Copie lue par la surveillance de latence, hors du thread Tk
+        self._mode_mesure = self._probe_mode()
+
+        self.tcp_probe_checkbox = ctk.CTkCheckBox(
+            options_card,
+            text="Mesurer la latence via TCP 1723 (PPTP)",
+            variable=self.tcp_probe_var,
+            command=self._sur_changement_mesure,
+            font=ctk.CTkFont(size=13),
+            corner_radius=5,
+            checkbox_width=22,
+            checkbox_height=22
+        )
+        self.tcp_probe_checkbox.pack(padx=20, pady=(0, 5), anchor="w")
+
+        tcp_note = ctk.CTkLabel(
+            options_card,
+            text="Utile lorsque le ping (ICMP) est filtré : vérifie que le service PPTP répond réellement.",
+            font=ctk.CTkFont(size=11),
+            text_color=COLORS["text_secondary"],
+            wraplength=600,
+            anchor="w",
+            justify="left"
+        )
+        tcp_note.pack(padx=20, pady=(0, 10), anchor="w")
+
+        # Pool de profils pré-configurés
+        self.pool_var = ctk.BooleanVar(value=False)
+
+        self.pool_checkbox = ctk.CTkCheckBox(
+            options_card,
+            text="Pré-configurer un profil par serveur (changement rapide)",
+            variable=self.pool_var,
+            command=self._sur_changement_pool,
+            font=ctk.CTkFont(size=13),
+            corner_radius=5,
+            checkbox_width=22,
+            checkbox_height=22
+        )
+        self.pool_checkbox.pack(padx=20, pady=(0, 5), anchor="w")
+
+        pool_note = ctk.CTkLabel(
+            options_card,
+            text="Crée en arrière-plan un profil Windows par serveur : changer de serveur ne nécessite plus de modifier le profil avant la connexion.",
+            font=ctk.CTkFont(size=11),
+            text_color=COLORS["text_secondary"],
+            wraplength=600,
+            anchor="w",
+            justify="left"
+        )
+        pool_note.pack(padx=20, pady=(0, 10), anchor="w")
+
+        # Course entre les serveurs les plus rapides
+        self.race_var = ctk.BooleanVar(value=False)
+
+        self.race_checkbox = ctk.CTkCheckBox(
+            options_card,
+            text=f"VPN le plus rapide : essayer les {RACE_TOP_K} meilleurs serveurs en décalé",
+            variable=self.race_var,
+            font=ctk.CTkFont(size=13),
+            corner_radius=5,
+            checkbox_width=22,
+            checkbox_height=22
+        )
+        self.race_checkbox.pack(padx=20, pady=(0, 5), anchor="w")
+
+        race_note = ctk.CTkLabel(
+            options_card,
+            text="Si le meilleur serveur ne répond pas rapidement, le suivant est lancé en parallèle ; le premier tunnel établi est conservé.",
+            font=ctk.CTkFont(size=11),
+            text_color=COLORS["text_secondary"],
+            wraplength=600,
+            anchor="w",
+            justify="left"
+        )
+        race_note.pack(padx=20, pady=(0, 10), anchor="w")
+
+        # Recherche « suffisamment bonne » pour VPN le plus rapide
+        self.good_enough_var = ctk.BooleanVar(value=False)
+
+        self.good_enough_checkbox = ctk.CTkCheckBox(
+            options_card,
+            text=f"VPN le plus rapide : s'arrêter au premier serveur sous {GOOD_ENOUGH_MS} ms",
+            variable=self.good_enough_var,
+            font=ctk.CTkFont(size=13),
+            corner_radius=5,
+            checkbox_width=22,
+            checkbox_height=22
+        )
+        self.good_enough_checkbox.pack(padx=20, pady=(0, 10), anchor="w")
+
+        # Supervision et reconnexion automatique
+        self.supervision_var = ctk.BooleanVar(value=True)
+
+        self.supervision_checkbox = ctk.CTkCheckBox(
+            options_card,
+            text="Reconnexion automatique (coupure ou connexion dégradée)",
+            variable=self.supervision_var,
+            font=ctk.CTkFont(size=13),
+            corner_radius=5,
+            checkbox_width=22,
+            checkbox_height=22
+        )
+        self.supervision_checkbox.pack(padx=20, pady=(0, 15), anchor="w")
 
     def _create_actions_section(self):
         """Crée la section des actions."""
@@ -407,11 +601,24 @@ class VPNApp(ctk.CTk):
     # -------------------- Utilitaires --------------------
 
     def _ajouter_log(self, texte):
-        """Ajoute une ligne de log dans la zone de texte."""
+        """Ajoute une ligne de log ; utilisable depuis n'importe quel thread."""
+        self._logs.push(texte)
+        self._ui.post("logs", self._vider_logs)
+
+    def _vider_logs(self):
+        """Affiche d'un bloc les lignes en attente et borne la zone de texte."""
+        lignes = self._logs.drain()
+        if not lignes:
+            return
         self.text_log.configure(state="normal")
-        self.text_log.insert("end", texte + "\n")
+        self.text_log.insert("end", "\n".join(lignes) + "\n")
+        total = int(self.text_log.index("end-1c").split(".")[0])
+        if total > LOG_MAX_LINES + 1:
+            self.text_log.delete("1.0", f"{total - LOG_MAX_LINES}.0")
         self.text_log.see("end")
         self.text_log.configure(state="disabled")
+        if self._logs.pending():
+            self._ui.post("logs", self._vider_logs)
 
     def _charger_mot_de_passe(self):
         if os.path.exists(MDP_FILE):
@@ -424,16 +631,27 @@ class VPNApp(ctk.CTk):
         with open(MDP_FILE, "w") as f:
             json.dump({"mot_de_passe": mot_de_passe}, f)
 
-    def _load_password_image(self):
+    def _load_password_image(self, revalider=False):
         """Charge l'image du mot de passe en arrière-plan."""
-        def worker():
-            mdp_image = fetch_vpnbook_password_image()
-            if mdp_image:
-                self.after(0, lambda: self._set_password_image(mdp_image))
-        threading.Thread(target=worker, daemon=True).start()
+        def worker(token):
+            try:
+                mdp_image = fetch_vpnbook_password_image(revalidate=revalider)
+            except Exception as ex:
+                self._ajouter_log(f"Image du mot de passe indisponible : {ex}")
+                self._ui.post(None, lambda: messagebox.showerror(
+                    "Erreur", "Impossible de récupérer l'image du mot de passe."
+                ))
+                return
+            if not token.cancelled:
+                self._ui.post("image_mdp", lambda: self._set_password_image(mdp_image))
+        # Un second clic pendant le chargement rejoint la tâche en cours
+        self._taches.submit("image_mdp", worker)
 
     def _set_password_image(self, image):
-        """Met à jour l'image du mot de passe."""
+        """Met à jour l'image du mot de passe (image PIL, sur le thread Tk)."""
+        from PIL import ImageTk
+
+        image = ImageTk.PhotoImage(image)
         self.label_mdp_img.configure(image=image)
         self.label_mdp_img.image = image
 
@@ -446,6 +664,41 @@ class VPNApp(ctk.CTk):
             self.status_indicator.configure(text_color=COLORS["accent_red"])
             self.status_label.configure(text="Déconnecté")
 
+    def _sur_changement_pool(self):
+        """(Re)lance la préparation des profils du pool si l'option est
+        active, l'arrête sinon."""
+        if self.pool_var.get():
+            self._ajouter_log("Préparation des profils VPN pré-configurés en arrière-plan...")
+            POOL.start_reconcile(self.split_tunneling_var.get())
+        else:
+            POOL.stop()
+
+    def _probe_mode(self):
+        """Retourne le mode de mesure de latence choisi dans les options."""
+        return "tcp" if self.tcp_probe_var.get() else "ping"
+
+    def _sur_changement_mesure(self):
+        """Transmet le nouveau mode de mesure à la surveillance en cours."""
+        self._mode_mesure = self._probe_mode()
+
+    def _lire_options(self):
+        """Relève, sur le thread Tk, les réglages utilisés par une connexion.
+
+        Les tâches de fond reçoivent ce dictionnaire au lieu de lire les
+        variables Tk, qui ne doivent être consultées que depuis ce thread.
+        """
+        self._mode_mesure = self._probe_mode()
+        return {
+            "serveur": strip_server_label(self.selected_server.get()),
+            "mot_de_passe": self.entry_mdp.get(),
+            "split": self.split_tunneling_var.get(),
+            "pool": self.pool_var.get(),
+            "course": self.race_var.get(),
+            "suffisant": self.good_enough_var.get(),
+            "supervision": self.supervision_var.get(),
+            "mode": self._mode_mesure,
+        }
+
     def _formater_message_erreur(self, output):
         """Retourne un message plus explicite en cas d'échec rasdial."""
         if not output:
@@ -453,15 +706,16 @@ class VPNApp(ctk.CTk):
 
         texte = output if isinstance(output, str) else str(output)
         texte_clean = texte.replace("\r", "").strip()
+        code = classer_erreur_rasdial(texte_clean)
 
-        if "807" in texte_clean:
+        if code == "807":
             return (
                 "Erreur 807 : la connexion a été interrompue (latence élevée ou serveur saturé).\n"
                 "Essayez un autre serveur VPN ou réessayez dans quelques instants.\n\n"
                 f"Détails rasdial : {texte_clean}"
             )
 
-        if "619" in texte_clean:
+        if code == "619":
             return (
                 "Erreur 619 : impossible d'établir la session.\n"
                 "Vérifiez vos identifiants, le réseau ou désactivez temporairement votre antivirus.\n\n"
@@ -477,40 +731,162 @@ class VPNApp(ctk.CTk):
         self._start_progress()
         self.bouton_connecter.configure(state="disabled")
         self.bouton_fastest.configure(state="disabled")
-        threading.Thread(target=self._connecter_thread).start()
+        options = self._lire_options()
+        self._taches.submit(
+            "connexion", lambda token: self._mesurer_connexion(lambda: self._connecter_thread(options))
+        )
+
+    def _mesurer_connexion(self, etapes):
+        """Exécute une connexion en regroupant ses mesures sous une même exécution.
+
+        ``etapes()`` retourne l'hôte connecté, ou None en cas d'échec : la
+        durée totale est enregistrée pour ce serveur et marquée en échec
+        sinon.
+        """
+        with SPANS.run():
+            debut = time.perf_counter()
+            hote = None
+            try:
+                hote = etapes()
+            finally:
+                SPANS.record(
+                    "connect_total", (time.perf_counter() - debut) * 1000, hote, ok=hote is not None
+                )
+        SPANS.write_prometheus()
 
     def _connecter_plus_rapide(self):
         self._ajouter_log("Recherche du serveur le plus rapide...")
         self._start_progress()
         self.bouton_connecter.configure(state="disabled")
         self.bouton_fastest.configure(state="disabled")
-        threading.Thread(target=self._connecter_plus_rapide_thread).start()
+        options = self._lire_options()
+        self._taches.submit(
+            "connexion",
+            lambda token: self._mesurer_connexion(lambda: self._connecter_plus_rapide_thread(options)),
+        )
 
-    def _connecter_plus_rapide_thread(self):
-        country, ip, latency = find_fastest_server()
+    def _connecter_plus_rapide_thread(self, options):
+        if options["course"]:
+            return self._connecter_course_thread(options)
+        if options["suffisant"]:
+            # Le pays sélectionné est sondé en premier
+            pays_prefere = SERVER_CHOICES.get(options["serveur"], (None,))[0]
+            with span("server_search"):
+                country, ip, latency = find_good_enough_server(
+                    preferred_country=pays_prefere, mode=options["mode"]
+                )
+        else:
+            with span("server_search"):
+                country, ip, latency = find_fastest_server(mode=options["mode"])
         if not ip:
-            self.after(0, self._stop_progress)
-            self.after(0, lambda: messagebox.showerror("Erreur", "Aucun serveur joignable."))
-            self.after(0, lambda: self._ajouter_log("Impossible de déterminer le serveur le plus rapide."))
+            self._ui.post("progression", self._stop_progress)
+            self._ui.post(None, lambda: messagebox.showerror("Erreur", "Aucun serveur joignable."))
+            self._ajouter_log("Impossible de déterminer le serveur le plus rapide.")
+            return None
+        self._ajouter_log(f"Serveur choisi : {ip} ({country}) - Latence : {latency} ms")
+        self._ajouter_log("Tentative de connexion...")
+        # Même tâche : la connexion suit directement la recherche
+        return self._connecter_thread(options, country, ip)
+
+    def _connecter_course_thread(self, options):
+        """Connexion en course entre les serveurs les mieux classés."""
+        with span("server_search"):
+            candidats = find_fastest_servers(RACE_TOP_K, mode=options["mode"])
+        if not candidats:
+            self._ui.post("progression", self._stop_progress)
+            self._ui.post(None, lambda: messagebox.showerror("Erreur", "Aucun serveur joignable."))
+            self._ajouter_log("Impossible de déterminer le serveur le plus rapide.")
             return
-        self.after(0, lambda: self._ajouter_log(f"Serveur choisi : {ip} ({country}) - Latence : {latency} ms"))
-        self.after(0, lambda: self._ajouter_log("Tentative de connexion..."))
-        threading.Thread(target=self._connecter_thread, args=(country, ip)).start()
-
-    def _connecter_thread(self, country=None, ip=None):
-        global stop_ping_thread
+        resume = ", ".join(f"{ip} ({latency} ms)" for _, ip, latency in candidats)
+        self._ajouter_log(f"Serveurs candidats : {resume}")
+
+        mot_de_passe = options["mot_de_passe"]
+        split_tunneling_enabled = options["split"]
+        self._arreter_supervision()
+        with span("is_connected"):
+            deja_connecte = est_connecte()
+        if deja_connecte:
+            self._ajouter_log("Déconnexion de la session VPN existante...")
+            with span("disconnect"):
+                deconnecter_vpn()
 
+        try:
+            with span("race"):
+                country, ip, nom_profil = race_connect(
+                    [(country, ip) for country, ip, _ in candidats],
+                    mot_de_passe,
+                    split_tunneling=split_tunneling_enabled,
+                    backend=RasdialBackend(pool=POOL if options["pool"] else None),
+                    on_event=self._ajouter_log,
+                )
+        except RaceFailed as e:
+            self._echec_connexion(self._formater_message_erreur(e.output))
+            return None
+        self._ajouter_log(f"Serveur retenu : {ip} ({country}) via le profil {nom_profil}.")
+        self._connexion_etablie(country, ip, nom_profil, options)
+        return ip
+
+    def _connexion_etablie(self, country, ip, nom_profil, options):
+        """Actions communes après l'établissement d'une connexion."""
+        mot_de_passe = options["mot_de_passe"]
+        self._enregistrer_mot_de_passe(mot_de_passe)
+        # Le délai jusqu'au premier échantillon de latence est mesuré à part
+        self._premiere_latence = (time.perf_counter(), ip)
+
+        self._ui.post("progression", self._stop_progress)
+        self._ui.post("statut", lambda: self._update_status(True))
+        self._ui.post(None, lambda: messagebox.showinfo("Succès", "Connexion établie avec succès."))
+        self._ajouter_log("Connexion établie avec succès.")
+
+        if country in ASCII_LOGOS:
+            self._ajouter_log(ASCII_LOGOS[country])
+
+        self._lancer_ping_thread(ip)
+        if options["supervision"]:
+            self._superviseur = Supervisor(
+                country,
+                ip,
+                nom_profil,
+                mot_de_passe,
+                split_tunneling=options["split"],
+                backend=RasdialBackend(
+                    pool=POOL if options["pool"] else None, shared=NOM_CONNEXION
+                ),
+                on_state=self._sur_etat_supervision,
+            )
+            self._superviseur.start()
+
+    def _arreter_supervision(self):
+        """Arrête la supervision en cours, avant une action manuelle."""
+        superviseur, self._superviseur = getattr(self, "_superviseur", None), None
+        if superviseur is not None:
+            superviseur.stop()
+
+    def _sur_etat_supervision(self, etat, country, ip, texte):
+        """Reflète dans l'interface les transitions du superviseur."""
+        self._ajouter_log(texte)
+        if etat == "connecte":
+            self._ip_surveillee = ip
+            self._ui.post("statut", lambda: self._update_status(True))
+        elif etat in ("reconnexion", "echec"):
+            self._ui.post("statut", lambda: self._update_status(False))
+        if etat == "echec":
+            self._ui.post(None, lambda: messagebox.showerror("Erreur", texte))
+
+    def _connecter_thread(self, options, country=None, ip=None):
         if ip is None or country is None:
-            label = self.selected_server.get()
-            label = re.sub(r"\s*\(.*?ms\)", "", label).strip()
-            country, ip = SERVER_CHOICES[label]
+            country, ip = SERVER_CHOICES[options["serveur"]]
 
-        mot_de_passe = self.entry_mdp.get()
-        split_tunneling_enabled = self.split_tunneling_var.get()
+        mot_de_passe = options["mot_de_passe"]
+        split_tunneling_enabled = options["split"]
+        self._arreter_supervision()
 
-        if est_connecte():
+        with span("is_connected"):
+            deja_connecte = est_connecte()
+        if deja_connecte:
             self._ajouter_log("Déconnexion de la session VPN existante...")
-            deconnecter_vpn()
+            with span("disconnect"):
+                deconnecter_vpn()
 
         try:
             if split_tunneling_enabled:
@@ -518,29 +894,54 @@ class VPNApp(ctk.CTk):
             else:
                 self._ajouter_log("Split tunneling désactivé : tout le trafic passera par le VPN.")
 
-            self._ajouter_log(f"Création ou mise à jour de la connexion vers {ip}...")
-            creer_ou_mettre_a_jour_vpn(ip, split_tunneling=split_tunneling_enabled)
+            nom_profil = POOL.profile_for(ip, split_tunneling_enabled) if options["pool"] else None
+            if nom_profil:
+                self._ajouter_log(f"Utilisation du profil pré-configuré {nom_profil}.")
+            else:
+                nom_profil = NOM_CONNEXION
+                self._ajouter_log(f"Création ou mise à jour de la connexion vers {ip}...")
+                with span("profile_update", ip):
+                    modifie = creer_ou_mettre_a_jour_vpn(ip, split_tunneling=split_tunneling_enabled)
+                if not modifie:
+                    self._ajouter_log("Profil VPN déjà à jour, aucune modification nécessaire.")
 
             self._ajouter_log("Connexion au VPN...")
-            connecter_vpn(mot_de_passe)
-            self._enregistrer_mot_de_passe(mot_de_passe)
-
-            self.after(0, self._stop_progress)
-            self.after(0, lambda: self._update_status(True))
-            self.after(0, lambda: messagebox.showinfo("Succès", "Connexion établie avec succès."))
-            self._ajouter_log("Connexion établie avec succès.")
-
-            if country in ASCII_LOGOS:
-                self._ajouter_log(ASCII_LOGOS[country])
-
-            self._lancer_ping_thread(ip)
-
-        except subprocess.CalledProcessError as e:
-            message = self._formater_message_erreur(getattr(e, "output", ""))
-            self.after(0, self._stop_progress)
-            self.after(0, lambda: self._update_status(False))
-            self.after(0, lambda: messagebox.showerror("Erreur", message))
-            self._ajouter_log(message)
+            debut = time.monotonic()
+            try:
+                with span("connect", ip):
+                    connecter_vpn(mot_de_passe, nom=nom_profil)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+                record_dial(ip, False, output=getattr(e, "output", "") or str(e))
+                raise
+            record_dial(ip, True, (time.monotonic() - debut) * 1000)
+            self._connexion_etablie(country, ip, nom_profil, options)
+            return ip
+
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            # Le profil a pu être modifié hors de l'application : le relire
+            invalider_profil()
+            POOL.invalidate(ip)
+            if isinstance(e, subprocess.CalledProcessError):
+                message = self._formater_message_erreur(getattr(e, "output", ""))
+            elif isinstance(e, subprocess.TimeoutExpired):
+                message = f"Échec de la connexion : la commande n'a pas répondu en {e.timeout:.0f} s."
+            else:
+                message = f"Échec de la connexion : {e}"
+            self._echec_connexion(message)
+
+    def _echec_connexion(self, message):
+        """Remet l'interface en état après une connexion échouée."""
+        self._ui.post("progression", self._stop_progress)
+        self._ui.post("statut", lambda: self._update_status(False))
+        self._ui.post(None, lambda: messagebox.showerror("Erreur", message))
+        self._ajouter_log(message)
+
+    def _sur_erreur_tache(self, cle, erreur):
+        """Exception non rattrapée dans une tâche de fond."""
+        self._ajouter_log(f"Erreur inattendue dans la tâche « {cle} » : {erreur!r}")
+        if cle == "connexion":
+            self._ui.post("progression", self._stop_progress)
+            self._ui.post("statut", lambda: self._update_status(False))
 
     def _start_progress(self):
         """Démarre l'animation de la barre de progression."""
@@ -554,8 +955,8 @@ class VPNApp(ctk.CTk):
             if current >= 1:
                 self.progress.set(0)
             else:
-                self.progress.set(current + 0.02)
-            self.after(50, self._animate_progress)
+                self.progress.set(current + PROGRESS_STEP)
+            self.after(PROGRESS_FRAME_MS, self._animate_progress)
 
     def _stop_progress(self):
         """Arrête la barre de progression."""
@@ -565,53 +966,82 @@ class VPNApp(ctk.CTk):
         self.bouton_fastest.configure(state="normal")
 
     def _deconnecter_action(self):
-        global stop_ping_thread
-        stop_ping_thread = True
+        self._taches.cancel("surveillance")
+        self._arreter_supervision()
         self._ajouter_log("Tentative de déconnexion...")
+        self._taches.submit("deconnexion", lambda token: self._deconnecter_thread())
+
+    def _deconnecter_thread(self):
         if deconnecter_vpn():
-            self._update_status(False)
-            messagebox.showinfo("Déconnexion", "Vous avez été déconnecté du VPN.")
+            self._ui.post("statut", lambda: self._update_status(False))
+            self._ui.post("latence", lambda: self.label_latency.configure(text="Latence : N/A"))
+            self._ui.post(None, lambda: messagebox.showinfo("Déconnexion", "Vous avez été déconnecté du VPN."))
             self._ajouter_log("Déconnexion réussie.")
-            self.label_latency.configure(text="Latence : N/A")
         else:
-            messagebox.showerror("Erreur", "Échec de la déconnexion ou aucune connexion n'était active.")
+            self._ui.post(None, lambda: messagebox.showerror(
+                "Erreur", "Échec de la déconnexion ou aucune connexion n'était active."
+            ))
             self._ajouter_log("Échec de la déconnexion ou aucune connexion active.")
 
     def _measure_and_update_latency(self, ip):
-        latence_ms = measure_latency(ip)
-        if latence_ms is not None:
-            self.after(0, lambda: self.label_latency.configure(text=f"Latence : {latence_ms} ms"))
+        latence_ms = measure_latency(ip, mode=self._mode_mesure)
+        attente, self._premiere_latence = self._premiere_latence, None
+        if attente is not None and latence_ms is not None:
+            SPANS.record("first_latency", (time.perf_counter() - attente[0]) * 1000, attente[1])
+        elif attente is not None:
+            self._premiere_latence = attente
+        stats = record_host_latency(ip, latence_ms)
+        if latence_ms is not None and stats is not None:
+            texte = (
+                f"Latence : {latence_ms} ms (moy. {stats.ewma:.0f} ms, "
+                f"gigue {stats.jitter:.0f} ms, perte {stats.loss_rate:.0%})"
+            )
+            self._ui.post("latence", lambda: self.label_latency.configure(text=texte))
+        elif latence_ms is not None:
+            self._ui.post("latence", lambda: self.label_latency.configure(text=f"Latence : {latence_ms} ms"))
         else:
-            self.after(0, lambda: self.label_latency.configure(text="Latence : N/A"))
+            # Une mesure perdue peut signaler une coupure : revérifier l'état
+            STATUS.refresh_soon()
+            self._ui.post("latence", lambda: self.label_latency.configure(text="Latence : N/A"))
 
-    def _ping_serveur(self, ip):
-        global stop_ping_thread
-        stop_ping_thread = False
-        while not stop_ping_thread:
+    def _ping_serveur(self, token):
+        while not token.cancelled:
             if est_connecte():
-                self._measure_and_update_latency(ip)
+                # Le serveur peut changer en cours de route (reprise automatique)
+                self._measure_and_update_latency(self._ip_surveillee)
             else:
-                self.after(0, lambda: self.label_latency.configure(text="Latence : N/A"))
-            time.sleep(2)
+                self._ui.post("latence", lambda: self.label_latency.configure(text="Latence : N/A"))
+            if token.wait(2):
+                return
 
     def _lancer_ping_thread(self, ip):
-        global ping_thread
-        if ping_thread and ping_thread.is_alive():
-            return
-        ping_thread = threading.Thread(target=self._ping_serveur, args=(ip,), daemon=True)
-        ping_thread.start()
+        self._ip_surveillee = ip
+        # Sans effet si la surveillance tourne déjà : elle suit _ip_surveillee
+        self._taches.submit("surveillance", self._ping_serveur)
 
     def _process_latency_queue(self):
+        """Intègre les latences reçues et retrie la liste sans perdre la sélection."""
+        changed = False
         try:
-            new_values = latency_queue.get_nowait()
+            while True:
+                label, texte, score = latency_queue.get_nowait()
+                self._server_entries[label] = (texte, score)
+                changed = True
         except queue.Empty:
             pass
-        else:
-            self.server_combobox.configure(values=new_values)
-            if new_values:
-                self.server_combobox.set(new_values[0])
-        finally:
-            self.after(100, self._process_latency_queue)
+        if changed:
+            selection = strip_server_label(self.selected_server.get())
+            ordre = sorted(
+                self._server_entries,
+                key=lambda lbl: (
+                    self._server_entries[lbl][1] is None,
+                    self._server_entries[lbl][1] or 0,
+                    self._server_order[lbl],
+                ),
+            )
+            self.server_combobox.configure(values=[self._server_entries[lbl][0] for lbl in ordre])
+            if selection in self._server_entries:
+                self.server_combobox.set(self._server_entries[selection][0])
 
     def _toggle_mot_de_passe(self):
         global show_password
@@ -624,21 +1054,32 @@ class VPNApp(ctk.CTk):
             self.bouton_show_mdp.configure(text="Afficher")
 
     def _sauvegarder_logs(self):
-        """Sauvegarde le contenu des logs dans un fichier texte."""
-        with open("vpn_logs.txt", "w", encoding="utf-8") as f:
-            contenu = self.text_log.get("1.0", "end").strip()
-            f.write(contenu)
-        messagebox.showinfo("Sauvegarde", "Les logs ont été sauvegardés dans vpn_logs.txt")
+        """Les logs sont déjà écrits au fil de l'eau : attendre les dernières lignes."""
+        self._logs.sink.flush()
+        messagebox.showinfo("Sauvegarde", f"Les logs sont enregistrés dans {LOG_FILE}")
 
     def _rafraichir_image_mdp(self):
         """Recharge l'image du mot de passe et met à jour le label."""
-        def worker():
-            img = fetch_vpnbook_password_image()
-            if img:
-                self.after(0, lambda: self._set_password_image(img))
-        threading.Thread(target=worker, daemon=True).start()
+        # Demande explicite : la page et l'image sont revalidées (304 au mieux)
+        self._load_password_image(revalider=True)
+
+    def _fermer(self):
+        """Arrête proprement les tâches de fond avant de fermer la fenêtre."""
+        self._arreter_supervision()
+        self._taches.shutdown(timeout=1.0)
+        self._logs.sink.flush(timeout=1.0)
+        SPANS.flush(timeout=1.0)
+        SPANS.write_prometheus()
+        self.destroy()
 
 
 if __name__ == "__main__":
+    diagnostics = Diagnostics.from_environment()
     app = VPNApp()
-    app.mainloop()
+    if diagnostics is None:
+        app.mainloop()
+    else:
+        app._ajouter_log(f"Mode diagnostic actif : rapports dans {DIAGNOSTICS_DIR}/ à la fermeture.")
+        diagnostics.attach(app)
+        with diagnostics.session():
+            app.mainloop()